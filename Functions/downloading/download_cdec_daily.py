@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 08:41:09 2026
+
+@author: alvar
+"""
+
+## daily reservoir storage and snow water content
+
+from ulmo import cdec
+import pandas as pd
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def get_daily_data(stations, sensor = 15, sensor_name = 'RESERVOIR STORAGE',
+                   startdate = '1991-01-01', enddate = None, n_threads = 16):
+    """Downloads daily CDEC data for many stations, with several requests at
+    the same time
+
+    Parameters
+    ----------
+    stations : list
+        The CDEC station ids
+    sensor : integer
+        The sensor number (15 for reservoir storage, 82 for snow water content)
+    sensor_name : str
+        The name of the sensor in the ulmo results ('RESERVOIR STORAGE' or
+        'SNOW')
+    startdate : str or dict
+        The beginning of the date range, or a dict with the beginning of the
+        date range of each station
+    enddate : str, optional
+        The end of the date range. If None, today
+    n_threads : integer
+        The number of requests at the same time
+
+    Returns
+    -------
+    dataframe
+        the daily values (station_id, date and value) of all the stations
+    """
+    if enddate is None:
+        enddate = pd.Timestamp.today().strftime('%Y-%m-%d')
+
+    def get_station(station):
+        start = startdate[station] if isinstance(startdate, dict) else startdate
+        try:
+            data = cdec.historical.get_data(station_ids=[station], sensor_ids=[sensor], resolutions=['daily'],
+                                            start = start, end = enddate)
+            if bool(data[list(data.keys())[0]]) == True:
+                data = data[list(data.keys())[0]][sensor_name].reset_index()
+                return data[['station_id', 'DATE TIME', 'value']]
+        except ValueError:
+            print('Error with station :' + station)
+        return None
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        data = [station_data for station_data in executor.map(get_station, stations) if station_data is not None]
+    if len(data)==0:
+        return pd.DataFrame(columns=['station_id', 'date', 'value'])
+    data = pd.concat(data).rename(columns={'DATE TIME': 'date'})
+    data['date'] = pd.to_datetime(data['date']).dt.normalize()
+    return data
+
+
+def update_daily_file(filename, stations, sensor = 15, sensor_name = 'RESERVOIR STORAGE',
+                      startdate = '1991-01-01', enddate = None, lookback_days = 30):
+    """Updates a csv file with daily CDEC data, downloading only the last days
+    of each station (CDEC revises recent values, so the last lookback_days of
+    each station are downloaded again). For the stations that are not in the
+    file (or if the file does not exist), all the data since startdate is
+    downloaded
+
+    Parameters
+    ----------
+    filename : str
+        The path to the csv file (station_id, date and value)
+    stations : list
+        The CDEC station ids
+    sensor, sensor_name : integer, str
+        As in get_daily_data
+    startdate : str
+        The beginning of the date range of the stations that are not in the
+        file
+    enddate : str, optional
+        The end of the date range. If None, today
+    lookback_days : integer
+        The number of days downloaded again
+
+    Returns
+    -------
+    dataframe
+        the daily values of all the stations, as written to disk
+    """
+    starts = {station: startdate for station in stations}
+    if os.path.exists(filename):
+        data = pd.read_csv(filename, parse_dates = ['date'], dtype = {'station_id': 'str'})
+        #Each station starts lookback_days before its own last day in the file
+        restart = data.groupby('station_id').date.max() - pd.Timedelta(days=lookback_days)
+        restart = restart.loc[restart.index.isin(list(starts))]
+        data = data.loc[~(data.date>=data.station_id.map(restart))]
+        starts.update({station: date.strftime('%Y-%m-%d') for station, date in restart.items()})
+    else:
+        data = pd.DataFrame(columns=['station_id', 'date', 'value'])
+
+    new_data = get_daily_data(stations, sensor, sensor_name, starts, enddate)
+    data = pd.concat([data, new_data]).drop_duplicates(['station_id', 'date'], keep='last')
+    data = data.sort_values(['station_id', 'date']).reset_index(drop=True)
+    data.to_csv(filename, index=False)
+    return data
+
+
+def regional_swc_daily(snow, snotels):
+    """Daily regional snow water content, as in download_cdec_snow but without
+    averaging by month: the daily percent of the April 1st normal of each
+    station is averaged by basin and multiplied by the April 1st regional SWE
+    (converted to AF), and then summed by hydrologic region
+
+    Parameters
+    ----------
+    snow : dataframe
+        The daily snow water content of the stations (station_id, date, value)
+    snotels : dataframe
+        The snow stations (station, Basin, HR and aprilmean)
+
+    Returns
+    -------
+    dataframe
+        the daily snow water content (SWC) of each hydrologic region
+    """
+    snow = snow.dropna(subset=['value'])
+
+    # calculate April 1st 'normal' for each sensor
+    april1 = (snow.date.dt.month==4) & (snow.date.dt.day==1)
+    normal = snow.loc[april1].groupby('station_id').value.mean().rename('normal')
+    snow = snow.merge(normal, left_on='station_id', right_index=True)
+    snow['percent_normal'] = snow['value']/snow['normal']
+
+    # daily basin average, multiplied by the April 1st regional SWE
+    snow = snow.merge(snotels[['station', 'Basin']], left_on='station_id', right_on='station')
+    basin = snow.groupby(['Basin', 'date']).percent_normal.mean().reset_index()
+    regions = snotels.groupby(['Basin', 'HR']).aprilmean.mean().reset_index()
+    basin_HR = basin.merge(regions, on='Basin')
+    basin_HR['SWC'] = basin_HR['percent_normal']*basin_HR['aprilmean']*810714
+
+    # summarize by region
+    regional = basin_HR.groupby(['HR', 'date']).SWC.sum().reset_index()
+    regional = regional.rename(columns={'HR': 'HR_NAME'})
+    return regional[['HR_NAME', 'date', 'SWC']]
+
+
+def download_daily_surface_storage(directory = '../../Data/Downloaded/cdec/',
+                                   startdate = '1991-01-01', enddate = None):
+    """Downloads (or updates) the daily reservoir storage and snow water
+    content, and obtains the daily regional snow water content
+
+    Parameters
+    ----------
+    directory : str
+        The path to the directory with the reservoir and snow subfolders
+    startdate : str
+        The beginning of the date range (for new files)
+    enddate : str, optional
+        The end of the date range. If None, today
+
+    Returns
+    -------
+    datafiles
+        reservoir/reservoirs_daily.csv (with the station data and capacity),
+        snow/snow_stations_daily.csv and snow/SnowRegionalDaily.csv
+    """
+    for subfolder in ['reservoir', 'snow']:
+        os.makedirs(os.path.join(directory, subfolder), exist_ok=True)
+
+    # reservoirs
+    reservoirstations = pd.read_csv('../../Data/Input_Data/cdec/reservoirstations_hrs.csv')
+    reservoircapacity = pd.read_csv('../../Data/Input_Data/cdec/reservoir_capacity.csv')
+    reservoirstations = reservoirstations.rename(columns={'ID': 'station', 'Station_Name': 'name'})
+    reservoirstations = reservoirstations[['station','name', 'Latitude','Longitude', 'River_Basin', 'HR_NAME']]
+
+    reservoirs = update_daily_file(os.path.join(directory, 'reservoir', 'reservoirs_daily_raw.csv'),
+                                   reservoirstations.station, sensor = 15, sensor_name = 'RESERVOIR STORAGE',
+                                   startdate = startdate, enddate = enddate)
+    reservoirs = reservoirs.rename(columns={'station_id': 'station'})
+    reservoirs = reservoirs.merge(reservoirstations, on='station')
+    reservoirs = reservoirs.merge(reservoircapacity[['station', 'capacity']], on='station', how='left')
+    reservoirs.to_csv(os.path.join(directory, 'reservoir', 'reservoirs_daily.csv'), index=False)
+
+    # snow
+    snotels = pd.read_csv('../../Data/Input_Data/cdec/snotels3.csv')
+    snow = update_daily_file(os.path.join(directory, 'snow', 'snow_stations_daily.csv'),
+                             snotels.station, sensor = 82, sensor_name = 'SNOW',
+                             startdate = startdate, enddate = enddate)
+    regional = regional_swc_daily(snow, snotels)
+    regional.to_csv(os.path.join(directory, 'snow', 'SnowRegionalDaily.csv'), index=False)
+
+
+# Download (or update) all data
+download_daily_surface_storage(directory = '../../Data/Downloaded/cdec/',
+                               startdate = '1991-01-01')
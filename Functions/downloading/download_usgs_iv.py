@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 28 08:15:42 2026
+
+@author: alvar
+"""
+
+## provisional daily streamflow from the instantaneous values (15-minute)
+
+import os
+import time
+import pandas as pd
+import dataretrieval.nwis as nwis
+from concurrent.futures import ThreadPoolExecutor
+
+
+#USGS daily values are means of the local standard time day (no daylight
+#saving time): PST for the California gages
+daily_timezone = 'Etc/GMT+8'
+provisional_columns = ['datetime', '00060_Mean', '00060_Mean_cd', 'site_no', 'lat', 'lon', 'HR_NAME', 'n_values']
+
+
+def iv_daily_means(site, startdate, enddate, window_days = 7, parameterCd = '00060',
+                   retries = 3, retry_wait = 10):
+    """Downloads the instantaneous values of one gage in windows of
+    window_days, reducing each window to the sum and number of values of each
+    day as it is downloaded, so the full instantaneous series is never in
+    memory. A window that fails is downloaded again up to retries times. If
+    it still fails, the download of the gage stops and the days from the day
+    before that window are not returned (they would be means of part of the
+    day), so the next update starts there again
+
+    Parameters
+    ----------
+    site : str
+        The USGS site number
+    startdate : str
+        The beginning of the date range
+    enddate : str
+        The end of the date range
+    window_days : integer
+        The number of days downloaded at a time
+    parameterCd : str
+        The parameter code ('00060' for discharge)
+    retries : integer
+        The number of times a failed window is downloaded again
+    retry_wait : float
+        The seconds before downloading a failed window again
+
+    Returns
+    -------
+    dataframe
+        the provisional daily mean (00060_Mean) and the number of
+        instantaneous values (n_values) of each day
+    """
+    #The local days end after the UTC days, so one more day is downloaded
+    last_day = pd.Timestamp(enddate) + pd.Timedelta(days=1)
+    days = []
+    window_starts = pd.date_range(startdate, last_day, freq = str(window_days)+'D')
+    for window_start in window_starts:
+        window_end = min(window_start + pd.Timedelta(days=window_days - 1), last_day)
+        iv = None
+        for attempt in range(retries + 1):
+            try:
+                iv = nwis.get_record(sites=[site], service='iv', start=window_start.strftime('%Y-%m-%d'),
+                                     end=window_end.strftime('%Y-%m-%d'), parameterCd=parameterCd)
+                break
+            except Exception:
+                print('Error with site :' + site + ' ' + window_start.strftime('%Y-%m-%d') +
+                      ' (attempt ' + str(attempt + 1) + ')')
+                if attempt < retries:
+                    time.sleep(retry_wait)
+        if iv is None:
+            #The day before the window has values of the window too (the
+            #local days end after the UTC days)
+            enddate = min(pd.Timestamp(enddate), window_start - pd.Timedelta(days=2))
+            break
+        if (len(iv)==0) or (parameterCd not in iv.columns):
+            continue
+        values = pd.to_numeric(iv[parameterCd], errors='coerce')
+        times = pd.DatetimeIndex(iv.index)
+        if times.tz is None:
+            times = times.tz_localize('UTC')
+        day = times.tz_convert(daily_timezone).tz_localize(None).normalize()
+        days.append(values.groupby(day).agg(['sum', 'count']))
+
+    if len(days)==0:
+        return pd.DataFrame(columns=['site_no', 'datetime', '00060_Mean', 'n_values'])
+    #The days at the border of two windows are added up
+    days = pd.concat(days).groupby(level=0).sum()
+    days = days.loc[(days['count']>0) & (days.index>=startdate) & (days.index<=enddate)]
+    return pd.DataFrame({'site_no': site,
+                         'datetime': days.index,
+                         '00060_Mean': (days['sum']/days['count']).to_numpy(),
+                         'n_values': days['count'].to_numpy()})
+
+
+def update_provisional_file(filename, stations, startdate = None, enddate = None,
+                            lookback_days = 60, min_values = 48, n_threads = 16,
+                            last_dv_date = None):
+    """Updates the provisional daily streamflow of the gages from their
+    instantaneous values. Only the days since the last day of each gage in
+    the file are downloaded (the last day again, as it can be incomplete).
+    Days with less than min_values instantaneous values (the current day) are
+    not written. The days already covered by the daily values of each gage
+    (last_dv_date) are removed from the file
+
+    Parameters
+    ----------
+    filename : str
+        The path to the csv file, with the layout of streamflow_daily_data.csv
+        (datetime, 00060_Mean, 00060_Mean_cd, site_no, lat, lon, HR_NAME) and
+        n_values
+    stations : dataframe
+        The gages (site, lat, lon and HR_NAME)
+    startdate : str, optional
+        The beginning of the date range of the gages that are not in the file.
+        If None, lookback_days before enddate
+    enddate : str, optional
+        The end of the date range. If None, today
+    lookback_days : integer
+        The number of days of the gages that are not in the file if startdate
+        is None
+    min_values : integer
+        The minimum number of instantaneous values of a day (96 for a complete
+        day of 15-minute values)
+    n_threads : integer
+        The number of gages downloaded at the same time
+    last_dv_date : series, optional
+        The date of the last daily value of each gage (site_no as index), as
+        in the gages of the daily streamflow dataset (streamflow_sites.parquet).
+        If None, no days are removed
+
+    Returns
+    -------
+    dataframe
+        the provisional daily streamflow of all the gages, as written to disk
+    """
+    if enddate is None:
+        enddate = pd.Timestamp.today().strftime('%Y-%m-%d')
+    if startdate is None:
+        startdate = (pd.Timestamp(enddate) - pd.Timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+    if os.path.exists(filename):
+        data = pd.read_csv(filename, dtype = {'site_no': 'str'}, parse_dates = ['datetime'])
+    else:
+        data = pd.DataFrame(columns=provisional_columns)
+
+    #Each gage of stations starts at its last day in the file (removed, as it
+    #is downloaded again)
+    last_day = data.loc[data.site_no.isin(stations.site)].groupby('site_no').datetime.max()
+    data = data.loc[~(data.datetime>=data.site_no.map(last_day))]
+    starts = stations.site.map(last_day).fillna(pd.Timestamp(startdate))
+
+    def get_site(site_start):
+        site, start = site_start
+        return iv_daily_means(site, start.strftime('%Y-%m-%d'), enddate)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        new_data = [site_data for site_data in executor.map(get_site, zip(stations.site, starts)) if len(site_data)>0]
+    if len(new_data)>0:
+        new_data = pd.concat(new_data)
+        new_data = new_data.loc[new_data.n_values>=min_values]
+        #Provisional values obtained from the instantaneous values
+        new_data['00060_Mean_cd'] = 'P:iv'
+        new_data = new_data.merge(stations[['site', 'lat', 'lon', 'HR_NAME']], left_on='site_no', right_on='site')
+        data = pd.concat([data, new_data.drop(columns='site')])
+
+    data['datetime'] = pd.to_datetime(data['datetime'])
+    data = data.drop_duplicates(['site_no', 'datetime'], keep='last')
+    #Days with daily values are not needed anymore
+    if last_dv_date is not None:
+        data = data.loc[~(data.datetime<=data.site_no.map(pd.to_datetime(last_dv_date)))]
+    data = data[provisional_columns]
+    data = data.sort_values(['site_no', 'datetime']).reset_index(drop=True)
+    data.to_csv(filename, index=False)
+    return data
+
+
+## inport streamgage site list
+
+stations = pd.read_csv("../../Data/Input_Data/usgs/sg_usgs_hr.csv")
+stations['site'] = stations['site'].astype(str)
+
+#Date of the last daily value of each gage (from the daily streamflow dataset)
+last_dv_date = None
+sites_file = '../../Data/Processed/usgs/streamflow_sites.parquet'
+if os.path.exists(sites_file):
+    sites = pd.read_parquet(sites_file)
+    if 'last_dv_date' in sites.columns:
+        last_dv_date = sites.set_index('site_no').last_dv_date
+
+update_provisional_file('../../Data/Downloaded/usgs/streamflow_provisional_daily.csv', stations,
+                        lookback_days = 60, last_dv_date = last_dv_date)
@@ -0,0 +1,919 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 10:05:44 2026
+
+@author: alvar
+"""
+
+import os
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.spatial.distance import pdist
+from scipy.optimize import least_squares
+from scipy.stats import norm
+from pykrige.ok import OrdinaryKriging
+from pykrige.variogram_models import exponential_variogram_model
+import rasterio
+import rasterio.shutil
+from rasterio.transform import from_origin
+from kriging_functions import krige_at_points, local_ordinary_kriging
+
+
+#Columns of the domestic wells used in the dry-well analysis
+well_columns = ['WCRNUMBER', 'DECIMALLONGITUDE', 'DECIMALLATITUDE',
+                'TOTALCOMPLETEDDEPTH', 'year', 'HR_NAME']
+
+#Version of the results of the dry-well jobs: it is part of the key of the
+#stored results, so it has to be changed when their columns (or their
+#calculation) change and the stored results are obtained again
+dry_wells_version = 3
+
+
+#Ordinary kriging object from the gw measurements of a HR and year. If
+#variogram_parameters ([psill, range, nugget]) are provided, the variogram is
+#not fitted again
+def ok_model(df, variogram_parameters = None):
+    data_elevations = df[['longitude','latitude','gse_gwe']].reset_index(drop=True)
+    data_elevations = data_elevations.loc[data_elevations.gse_gwe>0].to_numpy()
+
+    #Passed as a dict: pykrige reads a list as [sill, range, nugget]
+    if variogram_parameters is not None:
+        psill, vrange, nugget = [float(parameter) for parameter in variogram_parameters]
+        variogram_parameters = {'psill': psill, 'range': vrange, 'nugget': nugget}
+
+    # Generate ordinary kriging object
+    OK = OrdinaryKriging(
+        data_elevations[:, 0],
+        data_elevations[:, 1],
+        data_elevations[:, 2],
+        variogram_model = "exponential",
+        variogram_parameters = variogram_parameters,
+        verbose = False,
+        enable_plotting = False,
+    )
+    if (variogram_parameters is not None) and \
+       not np.allclose(OK.variogram_model_parameters, [psill, vrange, nugget]):
+        raise ValueError('The kriging variogram ' + str(list(OK.variogram_model_parameters)) +
+                         ' does not match the variogram parameters ' + str([psill, vrange, nugget]))
+    return OK
+
+
+def config_hash(*parts):
+    #Short hash of the settings and input data of a run (dataframes are hashed
+    #by their values), used to name or check the files stored on disk
+    key = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            key.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+        elif isinstance(part, np.ndarray):
+            key.update(repr(part.tolist()).encode())
+        elif isinstance(part, dict):
+            key.update(repr(sorted(part.items())).encode())
+        else:
+            key.update(repr(part).encode())
+    return key.hexdigest()[:16]
+
+
+def fit_variogram(gwdata, hr_name = 'San Joaquin River', years = np.arange(1991,2001),
+                  semester = 2, nlags = 6):
+    """Fits the exponential variogram of a hydrologic region for a group of
+    years (for instance, a decade). The semivariances are obtained only with
+    pairs of measurements of the same year, pooled for all the years, and
+    fitted as in pykrige (soft L1 least squares)
+
+    Parameters
+    ----------
+    gwdata : dataframe
+        The groundwater measurements (with HR_NAME, year, semester, longitude,
+        latitude and gse_gwe)
+    hr_name : str
+        The hydrologic region
+    years : list
+        The years used in the fit
+    semester : integer
+        The semester of the measurements (1 or 2)
+    nlags : integer
+        The number of distance bins
+
+    Returns
+    -------
+    dict
+        the variogram parameters (psill, range, nugget) and fit diagnostics
+        (number of points and pairs, rmse and r2 of the binned semivariances)
+    """
+
+    df = gwdata.loc[(gwdata.HR_NAME==hr_name) & (gwdata.year.isin(years)) &
+                    (gwdata.semester==semester) & (gwdata.gse_gwe>0)]
+    distances = []
+    semivariances = []
+    for _, dfyear in df.groupby('year'):
+        if len(dfyear)<2:
+            continue
+        distances.append(pdist(dfyear[['longitude','latitude']].to_numpy()))
+        semivariances.append(0.5*pdist(dfyear[['gse_gwe']].to_numpy(), 'sqeuclidean'))
+    result = {'HR_NAME': hr_name, 'start_year': int(np.min(years)), 'end_year': int(np.max(years)),
+              'semester': semester, 'n_points': len(df), 'n_pairs': 0,
+              'psill': np.nan, 'range': np.nan, 'nugget': np.nan, 'rmse': np.nan, 'r2': np.nan}
+    if len(distances)==0:
+        return result
+    distances = np.concatenate(distances)
+    semivariances = np.concatenate(semivariances)
+
+    #Experimental variogram with equal-sized bins
+    bins = np.linspace(distances.min(), distances.max() + 0.001, nlags + 1)
+    lag_index = np.digitize(distances, bins) - 1
+    counts = np.bincount(lag_index, minlength=nlags)[:nlags]
+    valid = counts>0
+    lags = (np.bincount(lag_index, weights=distances, minlength=nlags)[:nlags][valid]/counts[valid])
+    semivariance = (np.bincount(lag_index, weights=semivariances, minlength=nlags)[:nlags][valid]/counts[valid])
+
+    x0 = [np.amax(semivariance) - np.amin(semivariance), 0.25*np.amax(lags), np.amin(semivariance)]
+    bounds = ([0.0, 0.0, 0.0], [10.0*np.amax(semivariance), np.amax(lags), np.amax(semivariance)])
+    fit = least_squares(lambda m: exponential_variogram_model(m, lags) - semivariance,
+                        x0, bounds=bounds, loss='soft_l1')
+    residuals = exponential_variogram_model(fit.x, lags) - semivariance
+
+    result.update({'n_pairs': len(distances), 'psill': fit.x[0], 'range': fit.x[1], 'nugget': fit.x[2],
+                   'rmse': np.sqrt(np.mean(residuals**2)),
+                   'r2': 1 - np.sum(residuals**2)/np.sum((semivariance - semivariance.mean())**2)})
+    return result
+
+
+def variogram_table(gwdata, regions = None, years = np.arange(1991,2023), semesters = [2],
+                    period_length = 10, filename = '../../Data/Processed/groundwater/variogram_parameters.csv'):
+    """Fits the variograms once per region and period of years (a decade by
+    default) and stores them, with their diagnostics, in a csv file. The name
+    of the file includes a hash of the regions, years, semesters,
+    period_length and measurements, so the stored variograms are read only
+    for the same request and data (otherwise they are fitted again)
+
+    Parameters
+    ----------
+    gwdata : dataframe
+        The groundwater measurements
+    regions : list, optional
+        The hydrologic regions. If None, all the regions in gwdata
+    years : list
+        The years to cover
+    semesters : list
+        The semesters to cover
+    period_length : integer
+        The number of years of each period. If None, one period for all the years
+    filename : str
+        The path to the csv file (the hash is added to the name). If None, the
+        table is not stored
+
+    Returns
+    -------
+    dataframe
+        One row per region, period and semester with psill, range, nugget and
+        the diagnostics of fit_variogram
+    """
+    if regions is None:
+        regions = list(gwdata.HR_NAME.unique())
+    years = np.asarray(years)
+    if filename is not None:
+        used = gwdata.loc[gwdata.HR_NAME.isin(regions) & gwdata.year.isin(years) & gwdata.semester.isin(semesters),
+                          ['HR_NAME', 'year', 'semester', 'longitude', 'latitude', 'gse_gwe']]
+        root, extension = os.path.splitext(filename)
+        filename = root + '_' + config_hash(list(regions), years, list(semesters), period_length, used) + extension
+        if os.path.exists(filename):
+            #Read back exactly (the parameters are part of the job keys)
+            return pd.read_csv(filename, float_precision = 'round_trip')
+    if period_length is None:
+        periods = [years]
+    else:
+        periods = [years[(years>=start) & (years<start+period_length)]
+                   for start in np.arange(years.min(), years.max()+1, period_length)]
+
+    table = pd.DataFrame([fit_variogram(gwdata, hr_name, period, semester)
+                          for hr_name in regions for period in periods for semester in semesters])
+    if filename is not None:
+        table.to_csv(filename, index=False)
+    return table
+
+
+def variogram_for(table, hr_name, yr_n, semester = 2):
+    #Variogram parameters ([psill, range, nugget]) of the table for a region and
+    #year (None if there are no valid parameters, so the variogram is fitted)
+    row = table.loc[(table.HR_NAME==hr_name) & (table.start_year<=yr_n) &
+                    (table.end_year>=yr_n) & (table.semester==semester)]
+    if (len(row)==0) or row[['psill', 'range', 'nugget']].isna().any(axis=None):
+        return None
+    return row[['psill', 'range', 'nugget']].iloc[0].tolist()
+
+
+def wells_at_risk_points(gwdata, well_df, hr_name = 'San Joaquin River', yr_n = 2022,
+                         semester = 2, n_closest_points = None, search_radius = np.inf,
+                         variogram_parameters = None, OK = None, coverage = 'bbox'):
+    """Kriging the gw depth (and the kriging variance) only at the location of
+    the domestic wells (no grid), obtaining the failed and atrisk flags directly.
+    As with the grid of the measurements used before, the wells outside the
+    bounding box of the measurements of the year are not kriged (NaN, never
+    flagged) unless coverage is None
+
+    Parameters
+    ----------
+    gwdata : dataframe
+        The groundwater measurements (with HR_NAME, year, semester, longitude,
+        latitude and gse_gwe)
+    well_df : dataframe
+        The domestic wells (with HR_NAME, year of completion, coordinates and
+        TOTALCOMPLETEDDEPTH)
+    hr_name : str
+        The hydrologic region
+    yr_n : integer
+        The year of analysis
+    semester : integer
+        The semester of analysis (1 or 2)
+    n_closest_points : integer, optional
+        If provided, moving-neighborhood kriging with the n closest wells
+    search_radius : float
+        The search radius for the moving-neighborhood kriging
+    variogram_parameters : list, optional
+        The variogram parameters ([psill, range, nugget]), for instance from
+        variogram_table. If None, the variogram is fitted with the data
+    OK : OrdinaryKriging, optional
+        The kriging object of the measurements (from ok_model), if it is
+        already built
+    coverage : str, optional
+        'bbox' to krige only the wells inside the bounding box of the
+        measurements of the year. If None, all the wells of the region are
+        kriged (the wells far from the measurements get extrapolated values
+        close to the regional mean)
+
+    Returns
+    -------
+    dataframe
+        the wells of the region completed before yr_n, with gw_level,
+        gw_level_variance, failed and atrisk
+    """
+
+    df = gwdata.loc[(gwdata.HR_NAME==hr_name)]
+    df = df.loc[(df.year==yr_n) & (df.semester==semester)]
+
+    sel_wells = well_df
+    sel_wells = sel_wells.loc[sel_wells.HR_NAME == hr_name]
+
+    sel_wells = sel_wells.dropna(subset=['TOTALCOMPLETEDDEPTH'])
+
+    sel_wells = sel_wells.loc[sel_wells.year<yr_n].copy() #only the wells that were already completed
+
+    if OK is None:
+        OK = ok_model(df, variogram_parameters)
+    covered = np.ones(len(sel_wells), dtype=bool)
+    if coverage == 'bbox':
+        points = df.loc[df.gse_gwe>0]
+        covered = (sel_wells.DECIMALLONGITUDE.between(points.longitude.min(), points.longitude.max()) &
+                   sel_wells.DECIMALLATITUDE.between(points.latitude.min(), points.latitude.max())).to_numpy()
+    elif coverage is not None:
+        raise NameError("coverage has to be 'bbox' or None")
+    sel_wells['gw_level'] = np.nan
+    sel_wells['gw_level_variance'] = np.nan
+    if covered.any():
+        gw_level, gw_level_variance = krige_at_points(OK, sel_wells.loc[covered, 'DECIMALLONGITUDE'],
+                                                      sel_wells.loc[covered, 'DECIMALLATITUDE'],
+                                                      n_closest_points = n_closest_points,
+                                                      search_radius = search_radius)
+        sel_wells.loc[covered, 'gw_level'] = gw_level
+        sel_wells.loc[covered, 'gw_level_variance'] = gw_level_variance
+
+    sel_wells['failed'] = 0
+    sel_wells.loc[sel_wells.gw_level>sel_wells.TOTALCOMPLETEDDEPTH,'failed']=1
+    sel_wells['atrisk'] = 0
+    sel_wells.loc[sel_wells.gw_level > sel_wells.TOTALCOMPLETEDDEPTH - 30,'atrisk']=1
+
+    #Probability of failure (and of being at risk) from the kriging variance
+    sel_wells['p_failed'] = failure_probability(sel_wells.gw_level, sel_wells.gw_level_variance,
+                                                sel_wells.TOTALCOMPLETEDDEPTH)
+    sel_wells['p_atrisk'] = failure_probability(sel_wells.gw_level, sel_wells.gw_level_variance,
+                                                sel_wells.TOTALCOMPLETEDDEPTH - 30)
+
+    return sel_wells
+
+
+def failure_probability(gw_level, gw_level_variance, depth):
+    """Probability that the gw depth is below the bottom of the well (or any
+    other depth), assuming the kriged gw depth is normally distributed with the
+    kriged mean and variance
+
+    Parameters
+    ----------
+    gw_level : array
+        The kriged gw depth
+    gw_level_variance : array
+        The kriging variance
+    depth : array
+        The depth of the wells (for instance TOTALCOMPLETEDDEPTH, or
+        TOTALCOMPLETEDDEPTH - 30 for the wells at risk)
+
+    Returns
+    -------
+    array
+        the probability of gw_level > depth (NaN if gw_level is NaN)
+    """
+    gw_level = np.asarray(gw_level, dtype='float64')
+    depth = np.asarray(depth, dtype='float64')
+    sd = np.sqrt(np.clip(np.asarray(gw_level_variance, dtype='float64'), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        #With zero variance it is the deterministic flag
+        z = np.where(sd>0, (depth - gw_level)/sd, np.where(gw_level>depth, -np.inf, np.inf))
+    probability = norm.sf(z)
+    probability[np.isnan(gw_level) | np.isnan(depth)] = np.nan
+    return probability
+
+
+def expected_dry_wells(wells_hist, confidence = 0.9):
+    """Expected number of failed and at-risk wells by region, year and
+    semester from the failure probabilities, with confidence bands. The bands
+    use the normal approximation of the sum of independent Bernoulli variables
+    (variance sum of p*(1-p)), so they do not include the spatial correlation
+    of the kriging errors
+
+    Parameters
+    ----------
+    wells_hist : dataframe
+        The results of the dry-well jobs (with HR_NAME, analysis_year,
+        analysis_semester, failed, atrisk, p_failed and p_atrisk)
+    confidence : float
+        The confidence level of the bands
+
+    Returns
+    -------
+    dataframe
+        For each region, year and semester: the number of wells, the wells
+        failed and at risk (hard thresholds), and the expected wells failed and
+        at risk with their lower and upper bounds
+    """
+    df = wells_hist[['HR_NAME', 'analysis_year', 'analysis_semester', 'failed', 'atrisk',
+                     'p_failed', 'p_atrisk']].copy()
+    df['n_wells'] = 1
+    for flag in ['failed', 'atrisk']:
+        df['var_' + flag] = df['p_' + flag]*(1 - df['p_' + flag])
+    result = df.groupby(['HR_NAME', 'analysis_year', 'analysis_semester']).sum(min_count=1).reset_index()
+
+    z = norm.ppf(0.5 + confidence/2)
+    for flag in ['failed', 'atrisk']:
+        result = result.rename(columns={'p_' + flag: 'expected_' + flag})
+        sd = np.sqrt(result['var_' + flag])
+        result[flag + '_lower'] = np.clip(result['expected_' + flag] - z*sd, 0, None)
+        result[flag + '_upper'] = np.minimum(result['expected_' + flag] + z*sd, result['n_wells'])
+        result = result.drop(columns = 'var_' + flag)
+    return result
+
+
+def well_risk_history(wells_hist, flag = 'atrisk', job_log = None):
+    """Builds the history of each well from the long-form results of the
+    dry-well jobs as a sparse boolean matrix (wells x years), and the yearly
+    number of flagged wells by region from the same matrix. With the job log,
+    the region-years without a result (skipped or failed jobs) are NaN in the
+    counts instead of 0
+
+    Parameters
+    ----------
+    wells_hist : dataframe
+        The results of the jobs (from run_dry_wells or load_dry_wells), with
+        WCRNUMBER, HR_NAME, analysis_year, analysis_semester and the flag
+    flag : str
+        The column with the flag ('atrisk' or 'failed')
+    job_log : dataframe, optional
+        The log of the jobs (job_log.csv of run_dry_wells, or the timings of
+        run_statewide), with HR_NAME, year, semester and status. The last
+        entry of each job is used
+
+    Returns
+    -------
+    tuple
+        a dataframe with sparse boolean columns (flag_yyyy, or flag_yyyy_sN if
+        there are two semesters) and one row per well (WCRNUMBER), and a
+        dataframe with the number of flagged wells by region (rows) and year
+        (columns)
+    """
+    well_index, wells = pd.factorize(wells_hist['WCRNUMBER'], sort=True)
+    period_codes = (10*wells_hist['analysis_year'].to_numpy().astype('int64') +
+                    wells_hist['analysis_semester'].to_numpy().astype('int64'))
+    period_index, periods = pd.factorize(period_codes, sort=True)
+    periods = np.column_stack([periods//10, periods%10])
+    if len(np.unique(periods[:, 1]))>1:
+        columns = [flag + '_' + str(year) + '_s' + str(semester) for year, semester in periods]
+    else:
+        columns = [flag + '_' + str(year) for year, _ in periods]
+
+    flagged = wells_hist[flag].to_numpy()==1
+    matrix = sparse.csr_matrix((np.ones(flagged.sum(), dtype=bool),
+                                (well_index[flagged], period_index[flagged])),
+                               shape=(len(wells), len(periods)), dtype=bool)
+    history = pd.DataFrame.sparse.from_spmatrix(matrix, index=pd.Index(wells, name='WCRNUMBER'),
+                                                columns=columns)
+
+    #Yearly counts by region: membership matrix (regions x wells) times the history
+    well_regions = np.empty(len(wells), dtype=object)
+    well_regions[well_index] = wells_hist['HR_NAME'].to_numpy()
+    region_index, regions = pd.factorize(well_regions, sort=True)
+    membership = sparse.csr_matrix((np.ones(len(wells)), (region_index, np.arange(len(wells)))),
+                                   shape=(len(regions), len(wells)))
+    counts = pd.DataFrame((membership @ matrix.astype('float64')).toarray().astype(int),
+                          index=pd.Index(regions, name='HR_NAME'), columns=columns)
+
+    #Region-years whose job did not end with a result
+    if job_log is not None:
+        log = job_log.drop_duplicates(['HR_NAME', 'year', 'semester'], keep='last')
+        log = log.loc[log.HR_NAME.isin(regions)]
+        log_codes = 10*log['year'].to_numpy().astype('int64') + log['semester'].to_numpy().astype('int64')
+        period_columns = dict(zip(10*periods[:, 0] + periods[:, 1], columns))
+        counts = counts.astype('float64')
+        for hr_name, code, status in zip(log.HR_NAME, log_codes, log.status):
+            if status!='done' and code in period_columns:
+                counts.loc[hr_name, period_columns[code]] = np.nan
+    return history, counts
+
+
+def job_table(gwdata, regions = None, years = np.arange(1991,2023), semesters = [1, 2],
+              min_points = 10):
+    """Number of monitoring points (positive gw depth measurements) of every
+    (region, year, semester) job, and whether there are enough points to krige
+
+    Parameters
+    ----------
+    gwdata : dataframe
+        The groundwater measurements (with HR_NAME, year and semester)
+    regions : list, optional
+        The hydrologic regions. If None, all the regions in gwdata
+    years : list
+        The years of analysis
+    semesters : list
+        The semesters of analysis (1 and/or 2)
+    min_points : integer
+        The minimum number of points to run a job
+
+    Returns
+    -------
+    dataframe
+        One row per job with HR_NAME, year, semester, n_points and run
+    """
+    if regions is None:
+        regions = list(gwdata.HR_NAME.unique())
+    index = pd.MultiIndex.from_product([list(regions), [int(year) for year in years],
+                                        [int(semester) for semester in semesters]],
+                                       names=['HR_NAME', 'year', 'semester'])
+    counts = gwdata.loc[gwdata.gse_gwe>0].groupby(['HR_NAME', 'year', 'semester']).size()
+    jobs = counts.reindex(index, fill_value=0).rename('n_points').reset_index()
+    jobs['run'] = jobs.n_points>=min_points
+    return jobs
+
+
+def append_job_log(filename, rows):
+    #Adds the timings of finished (skipped or failed) jobs to a csv log. If the
+    #rows have other columns than the log, the log is written again with all
+    #of them
+    rows = pd.DataFrame(rows)
+    if os.path.exists(filename):
+        columns = pd.read_csv(filename, nrows=0).columns
+        if list(columns) != list(rows.columns):
+            rows = pd.concat([pd.read_csv(filename), rows], ignore_index=True)
+            rows.to_csv(filename, index=False)
+            return
+    rows.to_csv(filename, mode='a', index=False, header=not os.path.exists(filename))
+
+
+def job_filename(output_folder, hr_name, yr_n, semester):
+    #File with the result of one (region, year, semester) job
+    return os.path.join(output_folder, hr_name.replace(' ', '_') + '_' + str(yr_n) + '_s' + str(semester) + '.parquet')
+
+
+def job_is_done(filename, key):
+    #The result of a job is reused only if it was obtained with the same key
+    #(settings, input data and version), stored in filename.key
+    if not (os.path.exists(filename) and os.path.exists(filename + '.key')):
+        return False
+    with open(filename + '.key') as file:
+        return file.read().strip() == key
+
+
+def write_job_result(filename, key, write):
+    #Writes the result of a job (first to a temporary file, so an interrupted
+    #write is not taken as done) and then its key
+    if os.path.exists(filename + '.key'):
+        os.remove(filename + '.key')
+    write(filename + '.tmp')
+    os.replace(filename + '.tmp', filename)
+    with open(filename + '.key', 'w') as file:
+        file.write(key)
+
+
+def write_grid(path, Z, sigmasq):
+    #Kriged grid of a job (gw depth and kriging variance)
+    with open(path, 'wb') as file:
+        np.savez(file, Z=Z, sigmasq=sigmasq)
+
+
+def _dry_wells_job(gwdata, well_df, hr_name, yr_n, semester, filename, key, kwargs,
+                   grid = None, grid_filename = None, grid_key = None):
+    #Worker for run_dry_wells: the result is written as soon as it is obtained.
+    #If a grid (xgrid, ygrid) is given, the same kriging object also kriges the
+    #surface, written to grid_filename. Returns the number of wells and the
+    #time of the job
+    start = time.perf_counter()
+    OK = ok_model(gwdata.loc[(gwdata.HR_NAME==hr_name) & (gwdata.year==yr_n) & (gwdata.semester==semester)],
+                  kwargs.get('variogram_parameters'))
+    result = wells_at_risk_points(gwdata, well_df, hr_name = hr_name, yr_n = yr_n,
+                                  semester = semester, OK = OK, **kwargs)
+    result['analysis_year'] = yr_n
+    result['analysis_semester'] = semester
+    if grid is not None:
+        Z, sigmasq, _ = krig_surface(gwdata, grid[0], grid[1], OK = OK,
+                                     n_closest_points = kwargs.get('n_closest_points'),
+                                     search_radius = kwargs.get('search_radius', np.inf))
+        write_job_result(grid_filename, grid_key, lambda path: write_grid(path, Z, sigmasq))
+    write_job_result(filename, key, lambda path: result.to_parquet(path, index = False))
+    return len(result), time.perf_counter() - start
+
+
+def region_grid(gwdata, hr_name, res = 0.01):
+    #Grid (xgrid, and ygrid with rows from north to south) covering all the
+    #measurements of a region, shared by all its years. None without data
+    gw_region = gwdata.loc[(gwdata.HR_NAME==hr_name) & (gwdata.gse_gwe>0)]
+    if len(gw_region)==0:
+        return None
+    xgrid = np.arange(gw_region.longitude.min(), gw_region.longitude.max()+res, res)
+    ygrid = np.arange(gw_region.latitude.min(), gw_region.latitude.max()+res, res)[::-1]
+    return xgrid, ygrid
+
+
+def surface_files(surfaces_folder, hr_name):
+    #GeoTIFFs with the kriged surfaces and variances of a region
+    name = hr_name.replace(' ', '_')
+    return (os.path.join(surfaces_folder, name + '_gw_depth.tif'),
+            os.path.join(surfaces_folder, name + '_gw_depth_variance.tif'))
+
+
+def write_region_surfaces(surfaces_folder, hr_name, grid, bands, res = 0.01):
+    """Writes the surfaces of a region from the kriged grids of its jobs: a
+    Cloud-Optimized GeoTIFF with the kriged gw depth and another one with the
+    kriging variance, one band per year and semester ('yyyy_sN')
+
+    Parameters
+    ----------
+    surfaces_folder : str
+        The path to the folder with the GeoTIFFs
+    hr_name : str
+        The hydrologic region
+    grid : tuple
+        The xgrid and ygrid of the region (from region_grid)
+    bands : list
+        The description of each band and the file with its kriged grid (None
+        for the jobs skipped or failed, written as NaN)
+    res : float
+        The resolution of the grid (degrees)
+
+    Returns
+    -------
+    tuple
+        the paths to the surface and variance GeoTIFFs
+    """
+    xgrid, ygrid = grid
+    empty = np.full((len(ygrid), len(xgrid)), np.nan, dtype='float32')
+    surfaces, variances = [], []
+    for _, grid_filename in bands:
+        if grid_filename is None:
+            surfaces.append(empty)
+            variances.append(empty)
+            continue
+        with np.load(grid_filename) as kriged:
+            surfaces.append(kriged['Z'])
+            variances.append(kriged['sigmasq'])
+    descriptions = [description for description, _ in bands]
+    files = surface_files(surfaces_folder, hr_name)
+    write_raster_stack(files[0], surfaces, descriptions, res, xgrid[0], ygrid[0])
+    write_raster_stack(files[1], variances, descriptions, res, xgrid[0], ygrid[0])
+    return files
+
+
+def run_dry_wells(gwdata, well_df, regions = None, years = np.arange(1991,2023),
+                  semesters = [2], output_folder = '../../Data/Processed/groundwater/dry_wells/',
+                  n_jobs = None, variograms = None, min_points = 10, surfaces_folder = None,
+                  res = 0.01, **kwargs):
+    """Runs the dry-well analysis for every (region, year, semester) job in a
+    process pool. Each job gets only its own measurements and wells, and its
+    result is written to output_folder when it completes. Jobs with a result
+    already on disk are not run again, so an interrupted run resumes where it
+    left off, unless the settings, the input data of the job or the version
+    of the results (dry_wells_version) changed. Jobs with fewer than
+    min_points measurements are skipped. A job that fails is reported and the
+    other jobs go on. The time of each job (and the skipped and failed jobs)
+    is added to job_log.csv in output_folder. If surfaces_folder is given,
+    each job also kriges the surface of its region with the same kriging
+    object, and the surfaces of each region are written as GeoTIFFs (see
+    write_region_surfaces) when all its jobs are done
+
+    Parameters
+    ----------
+    gwdata : dataframe
+        The groundwater measurements (with HR_NAME, year and semester)
+    well_df : dataframe
+        The domestic wells (with HR_NAME)
+    regions : list, optional
+        The hydrologic regions. If None, all the regions in gwdata
+    years : list
+        The years of analysis
+    semesters : list
+        The semesters of analysis (1 and/or 2)
+    output_folder : str
+        The path to the folder with the results of each job
+    n_jobs : integer, optional
+        The number of processes. If None, the number of processors
+    variograms : dataframe, optional
+        The variograms from variogram_table, used instead of fitting the
+        variogram in each job
+    min_points : integer
+        The minimum number of measurements to run a job
+    surfaces_folder : str, optional
+        The path to the folder with the kriged surfaces. If None, the
+        surfaces are not kriged
+    res : float
+        The resolution of the surfaces (degrees)
+    kwargs :
+        Other arguments passed to wells_at_risk_points
+
+    Returns
+    -------
+    dataframe
+        the results of all the jobs (see load_dry_wells)
+    """
+    if regions is None:
+        regions = list(gwdata.HR_NAME.unique())
+    os.makedirs(output_folder, exist_ok=True)
+    log_file = os.path.join(output_folder, 'job_log.csv')
+    well_df = well_df[[column for column in well_columns if column in well_df.columns]]
+    job_points = job_table(gwdata, regions, years, semesters, min_points).set_index(['HR_NAME', 'year', 'semester'])
+    if surfaces_folder is not None:
+        os.makedirs(os.path.join(surfaces_folder, 'jobs'), exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        jobs = {}
+        skipped = []
+        #Bands of the surfaces of each region (description and kriged grid)
+        #and number of jobs of the region still running
+        grids, bands, pending = {}, {}, {}
+        for hr_name in regions:
+            gw_region = gwdata.loc[gwdata.HR_NAME==hr_name, ['HR_NAME', 'year', 'semester', 'longitude', 'latitude', 'gse_gwe']]
+            wells_region = well_df.loc[well_df.HR_NAME==hr_name]
+            wells_key = config_hash(wells_region)
+            grid = None if surfaces_folder is None else region_grid(gw_region, hr_name, res)
+            if grid is not None:
+                grids[hr_name], bands[hr_name], pending[hr_name] = grid, [], 0
+            for yr_n in years:
+                for semester in semesters:
+                    filename = job_filename(output_folder, hr_name, yr_n, semester)
+                    n_points, run = job_points.loc[(hr_name, int(yr_n), int(semester))]
+                    band = [str(yr_n) + '_s' + str(semester), None]
+                    if grid is not None:
+                        bands[hr_name].append(band)
+                    if not run:
+                        skipped.append({'HR_NAME': hr_name, 'year': int(yr_n), 'semester': int(semester),
+                                        'n_points': n_points, 'n_wells': 0, 'seconds': np.nan,
+                                        'status': 'skipped', 'error': ''})
+                        continue
+                    gw_job = gw_region.loc[(gw_region.year==yr_n) & (gw_region.semester==semester)]
+                    job_kwargs = dict(kwargs)
+                    if variograms is not None:
+                        job_kwargs['variogram_parameters'] = variogram_for(variograms, hr_name, yr_n, semester)
+                    key = config_hash(dry_wells_version, hr_name, int(yr_n), int(semester),
+                                      job_kwargs, gw_job, wells_key)
+                    grid_filename, grid_key = None, None
+                    if grid is not None:
+                        grid_filename = os.path.join(surfaces_folder, 'jobs',
+                                                     os.path.basename(filename).replace('.parquet', '.npz'))
+                        grid_key = config_hash(key, res, grid[0], grid[1])
+                    if job_is_done(filename, key) and \
+                       ((grid is None) or job_is_done(grid_filename, grid_key)):
+                        band[1] = grid_filename
+                        continue
+                    #Results obtained with other settings or data are removed
+                    #(so they are not read if the job fails)
+                    for stale in [filename, grid_filename]:
+                        for stale_file in ([] if stale is None else [stale, stale + '.key']):
+                            if os.path.exists(stale_file):
+                                os.remove(stale_file)
+                    job = executor.submit(_dry_wells_job, gw_job, wells_region, hr_name,
+                                          int(yr_n), int(semester), filename, key, job_kwargs,
+                                          grid, grid_filename, grid_key)
+                    jobs[job] = (hr_name, int(yr_n), int(semester), n_points, band, grid_filename)
+                    if grid is not None:
+                        pending[hr_name] += 1
+        if len(skipped)>0:
+            append_job_log(log_file, skipped)
+            print('Skipped (less than ' + str(min_points) + ' points): ' + str(len(skipped)) + ' jobs')
+
+        #Regions with all their jobs already done
+        for hr_name in grids:
+            if pending[hr_name]==0:
+                write_region_surfaces(surfaces_folder, hr_name, grids[hr_name], bands[hr_name], res)
+
+        for job in as_completed(jobs):
+            hr_name, yr_n, semester, n_points, band, grid_filename = jobs[job]
+            try:
+                n_wells, seconds = job.result()
+                band[1] = grid_filename
+                append_job_log(log_file, [{'HR_NAME': hr_name, 'year': yr_n, 'semester': semester,
+                                           'n_points': n_points, 'n_wells': n_wells, 'seconds': seconds,
+                                           'status': 'done', 'error': ''}])
+                print('Done: ' + hr_name + ' ' + str(yr_n) + ' ' + str(semester) +
+                      ' (' + format(seconds, '.1f') + ' s)')
+            except Exception as error:
+                append_job_log(log_file, [{'HR_NAME': hr_name, 'year': yr_n, 'semester': semester,
+                                           'n_points': n_points, 'n_wells': 0, 'seconds': np.nan,
+                                           'status': 'failed', 'error': repr(error)}])
+                print('Failed: ' + hr_name + ' ' + str(yr_n) + ' ' + str(semester) + ' (' + repr(error) + ')')
+            if hr_name in grids:
+                pending[hr_name] -= 1
+                if pending[hr_name]==0:
+                    write_region_surfaces(surfaces_folder, hr_name, grids[hr_name], bands[hr_name], res)
+
+    return load_dry_wells(output_folder, regions, years, semesters)
+
+
+def load_dry_wells(output_folder = '../../Data/Processed/groundwater/dry_wells/',
+                   regions = None, years = None, semesters = None):
+    """Reads the results of the dry-well jobs
+
+    Parameters
+    ----------
+    output_folder : str
+        The path to the folder with the results of each job
+    regions, years, semesters : list, optional
+        The jobs to read. If None, all of them
+
+    Returns
+    -------
+    dataframe
+        the wells with gw_level, failed and atrisk for each job (identified by
+        HR_NAME, analysis_year and analysis_semester)
+    """
+    files = sorted(file for file in os.listdir(output_folder) if file.endswith('.parquet'))
+    if len(files)==0:
+        return pd.DataFrame()
+    results = pd.concat([pd.read_parquet(os.path.join(output_folder, file)) for file in files])
+    if regions is not None:
+        results = results.loc[results.HR_NAME.isin(regions)]
+    if years is not None:
+        results = results.loc[results.analysis_year.isin(years)]
+    if semesters is not None:
+        results = results.loc[results.analysis_semester.isin(semesters)]
+    return results.reset_index(drop=True)
+
+
+def krig_surface(gwdata, xgrid, ygrid, variogram_parameters = None,
+                 n_closest_points = None, search_radius = np.inf, OK = None):
+    #Kriged gw depth and kriging variance on a grid for the measurements of one
+    #(region, year, semester), and the time taken. The kriging object (OK) can
+    #be given if it is already built. NaN if the kriging fails
+    start = time.perf_counter()
+    try:
+        if OK is None:
+            OK = ok_model(gwdata, variogram_parameters)
+        if n_closest_points is None:
+            Z, sigmasq = OK.execute('grid', xgrid, ygrid)
+        else:
+            Z, sigmasq = local_ordinary_kriging(OK, 'grid', xgrid, ygrid,
+                                                n_closest_points = n_closest_points,
+                                                search_radius = search_radius)
+        Z = np.ma.filled(np.ma.asarray(Z, dtype='float32'), np.nan)
+        sigmasq = np.ma.filled(np.ma.asarray(sigmasq, dtype='float32'), np.nan)
+    except (ValueError, np.linalg.LinAlgError):
+        Z = np.full((len(ygrid), len(xgrid)), np.nan, dtype='float32')
+        sigmasq = np.full((len(ygrid), len(xgrid)), np.nan, dtype='float32')
+    return Z, sigmasq, time.perf_counter() - start
+
+
+def write_raster_stack(filename, bands, descriptions, res, min_x, max_y, crs = 'epsg:4326'):
+    """Writes a list of grids as a Cloud-Optimized GeoTIFF (tiled, compressed
+    and with overviews), one band per grid
+
+    Parameters
+    ----------
+    filename : str
+        The path to the GeoTIFF
+    bands : list
+        The grids, with rows from north to south
+    descriptions : list
+        The description of each band (for instance '2022_s2')
+    res : float
+        The resolution of the grids
+    min_x : float
+        The x coordinate of the center of the first column
+    max_y : float
+        The y coordinate of the center of the first row
+    crs : str
+        The coordinate reference system
+    """
+    profile = {'driver': 'GTiff', 'height': bands[0].shape[0], 'width': bands[0].shape[1],
+               'count': len(bands), 'dtype': 'float32', 'nodata': np.nan, 'crs': crs,
+               'transform': from_origin(min_x - res/2, max_y + res/2, res, res),
+               'tiled': True, 'blockxsize': 256, 'blockysize': 256}
+    tmp_filename = filename + '.tmp.tif'
+    with rasterio.open(tmp_filename, 'w', **profile) as dst:
+        for band, (data, description) in enumerate(zip(bands, descriptions), start=1):
+            dst.write(data.astype('float32'), band)
+            dst.set_band_description(band, description)
+    #The COG driver adds the overviews and the tiled, compressed layout
+    rasterio.shutil.copy(tmp_filename, filename, driver='COG', compress='DEFLATE',
+                         predictor='3', blocksize=256, overview_resampling='average')
+    os.remove(tmp_filename)
+
+
+def run_statewide(gwdata, well_df, regions = None, years = np.arange(1991,2023), semesters = [1, 2],
+                  min_points = 10, period_length = 10, surfaces = True,
+                  output_folder = '../../Data/Processed/groundwater/statewide/',
+                  n_jobs = None, n_closest_points = 30, search_radius = 0.5, **kwargs):
+    """Runs the kriging and dry-well analysis for every hydrologic region with
+    enough monitoring points, both semesters and any range of years: fits the
+    variograms by region and period and runs the dry-well jobs, which
+    (optionally) also krige the surfaces. Region-years with fewer than min_points
+    measurements are skipped and reported in the job logs.
+
+    By default the kriging uses a moving neighborhood (the n_closest_points
+    measurements within search_radius), so the memory of each job grows with
+    the number of grid cells and wells times n_closest_points. Global kriging
+    (n_closest_points = None) solves every grid cell against all the
+    measurements of the region at once: with a 0.01 degree grid of the large
+    regions (San Joaquin River, Sacramento River) and n_jobs processes at the
+    same time it can run out of memory, so n_jobs should be reduced then
+
+    Parameters
+    ----------
+    gwdata : dataframe
+        The groundwater measurements (with HR_NAME, year and semester)
+    well_df : dataframe
+        The domestic wells (with HR_NAME)
+    regions : list, optional
+        The hydrologic regions. If None, all the regions in gwdata with at
+        least one job with min_points measurements
+    years : list
+        The years of analysis
+    semesters : list
+        The semesters of analysis (1 and/or 2)
+    min_points : integer
+        The minimum number of measurements to run a job
+    period_length : integer
+        The number of years of each variogram period (see variogram_table)
+    surfaces : boolean
+        If True, the kriged surfaces are also written (see
+        write_region_surfaces)
+    output_folder : str
+        The path to the folder with the variograms, the dry-well results
+        (dry_wells/) and the kriged surfaces (kriged_surfaces/)
+    n_jobs : integer, optional
+        The number of processes. If None, the number of processors
+    n_closest_points : integer, optional
+        The number of closest measurements of the moving-neighborhood kriging.
+        If None, global kriging
+    search_radius : float
+        The search radius of the moving-neighborhood kriging (degrees)
+    kwargs :
+        Other arguments passed to wells_at_risk_points
+
+    Returns
+    -------
+    dict
+        the job table ('jobs'), the variograms ('variograms'), the dry-well
+        results ('wells'), the GeoTIFFs of each region ('surfaces') and the
+        timings of the jobs ('timings')
+    """
+    jobs = job_table(gwdata, regions, years, semesters, min_points)
+    if regions is None:
+        regions = list(jobs.loc[jobs.run, 'HR_NAME'].unique())
+        jobs = jobs.loc[jobs.HR_NAME.isin(regions)].reset_index(drop=True)
+    os.makedirs(output_folder, exist_ok=True)
+
+    variograms = variogram_table(gwdata, regions, years, semesters, period_length,
+                                 filename = os.path.join(output_folder, 'variogram_parameters.csv'))
+    wells_folder = os.path.join(output_folder, 'dry_wells')
+    surfaces_folder = os.path.join(output_folder, 'kriged_surfaces') if surfaces else None
+    wells = run_dry_wells(gwdata, well_df, regions, years, semesters, output_folder = wells_folder,
+                          n_jobs = n_jobs, variograms = variograms, min_points = min_points,
+                          surfaces_folder = surfaces_folder, n_closest_points = n_closest_points,
+                          search_radius = search_radius, **kwargs)
+    timings = pd.read_csv(os.path.join(wells_folder, 'job_log.csv')).assign(task = 'dry_wells')
+
+    #The surfaces are kriged in the dry-well jobs
+    files = {}
+    if surfaces:
+        files = {hr_name: surface_files(surfaces_folder, hr_name) for hr_name in regions
+                 if os.path.exists(surface_files(surfaces_folder, hr_name)[0])}
+
+    #Logs of resumed runs repeat the skipped jobs: the last entry is kept
+    timings = timings.drop_duplicates(['task', 'HR_NAME', 'year', 'semester'], keep='last').reset_index(drop=True)
+    return {'jobs': jobs, 'variograms': variograms, 'wells': wells,
+            'surfaces': files, 'timings': timings}
+
+
+def surface_band(filename, yr_n, semester = 2):
+    #Band number of a year and semester in a GeoTIFF from write_region_surfaces
+    with rasterio.open(filename) as src:
+        return list(src.descriptions).index(str(yr_n) + '_s' + str(semester)) + 1
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:40 2026
+
+@author: alvar
+"""
+
+import os
+import shutil
+import pandas as pd
+from spatial_assignment import add_region_column
+
+
+#Columns (and types) used from the periodic groundwater level bulk download
+#Data from: https://data.cnra.ca.gov/dataset/periodic-groundwater-level-measurements
+measurement_columns = {'site_code': 'str',
+                       'gse_gwe': 'float64'}
+station_columns = {'site_code': 'str',
+                   'stn_id': 'int64',
+                   'latitude': 'float64',
+                   'longitude': 'float64',
+                   'basin_code': 'str',
+                   'basin_name': 'str',
+                   'county_name': 'str',
+                   'well_depth': 'float64'}
+
+
+def source_stamp(files):
+    #Size and modification time of the files a dataset is converted from
+    return '\n'.join(str(os.path.getsize(file)) + ' ' + repr(os.path.getmtime(file)) for file in files)
+
+
+def is_current(stamp_file, files):
+    #True if the dataset was converted from the files as they are now (their
+    #stamp is stored in stamp_file). If the files do not exist, the existing
+    #dataset is used
+    if not os.path.exists(stamp_file):
+        return False
+    if not all(os.path.exists(file) for file in files):
+        return True
+    with open(stamp_file) as file:
+        return file.read().strip() == source_stamp(files)
+
+
+def convert_periodic_gwl(input_folder = '../../Data/Downloaded/groundwater/periodic_gwl_bulkdatadownload/',
+                         hr_shapefile = '../../Data/Input_Data/HRs/i03_Hydrologic_Regions.shp',
+                         output_folder = '../../Data/Processed/groundwater/periodic_gwl_parquet/',
+                         partition_by = 'HR_NAME'):
+    """Converts the bulk download of periodic groundwater level measurements
+    into a typed, compressed parquet dataset. The dataset is written to a
+    temporary folder that then replaces the existing dataset, with the stamp
+    of the download (_source.txt, see is_current), so an interrupted
+    conversion never leaves a partial dataset
+
+    Parameters
+    ----------
+    input_folder : str
+        The path to the folder with measurements.csv and stations.csv
+    hr_shapefile : str
+        The path to the hydrologic regions shapefile, used to add HR_NAME to
+        the stations
+    output_folder : str
+        The path to the parquet dataset that will be written
+    partition_by : str
+        The column used to partition the dataset. It can be 'HR_NAME' (one
+        partition per hydrologic region) or 'year'
+
+    Returns
+    -------
+    dataframe
+        the measurements merged with the stations, as written to disk
+    """
+
+    input_files = [os.path.join(input_folder, 'measurements.csv'), os.path.join(input_folder, 'stations.csv')]
+    stamp = source_stamp(input_files)
+
+    #Only the needed columns are read, with their types and parsing the dates once
+    gwdata = pd.read_csv(input_files[0], usecols = list(measurement_columns) + ['msmt_date'],
+                         dtype = measurement_columns, parse_dates = ['msmt_date'])
+    stations = pd.read_csv(input_files[1], usecols = list(station_columns), dtype = station_columns)
+
+    #Adding hydrologic region to the stations (assignments are cached)
+    stations = add_region_column(stations, lon_column = 'longitude', lat_column = 'latitude',
+                                 shapefile = hr_shapefile, name_column = 'HR_NAME')
+
+    #Merging data with stations
+    gwdata = gwdata.merge(stations, on='site_code')
+    gwdata['year'] = gwdata['msmt_date'].dt.year
+
+    output_folder = os.path.normpath(output_folder)
+    temp_folder = output_folder + '.tmp'
+    if os.path.exists(temp_folder):
+        shutil.rmtree(temp_folder)
+    gwdata.to_parquet(temp_folder, partition_cols = [partition_by],
+                      compression = 'zstd', index = False)
+    #Files starting with _ are not read as data
+    with open(os.path.join(temp_folder, '_source.txt'), 'w') as file:
+        file.write(stamp)
+    if os.path.exists(output_folder):
+        shutil.rmtree(output_folder)
+    os.rename(temp_folder, output_folder)
+    return gwdata
+
+
+def load_periodic_gwl(folder = '../../Data/Processed/groundwater/periodic_gwl_parquet/',
+                      regions = None, years = None, columns = None,
+                      partition_by = 'HR_NAME',
+                      input_folder = '../../Data/Downloaded/groundwater/periodic_gwl_bulkdatadownload/',
+                      **convert_kwargs):
+    """Loads the periodic groundwater level measurements from the parquet
+    dataset, converting the bulk download first if the dataset does not exist
+    or was converted from an older download
+
+    Parameters
+    ----------
+    folder : str
+        The path to the parquet dataset
+    regions : list, optional
+        Hydrologic regions (HR_NAME) to load. If None, all of them
+    years : list, optional
+        Years to load. If None, all of them
+    columns : list, optional
+        Columns to load. If None, all of them
+    partition_by : str
+        The partition column used if the dataset has to be created
+    input_folder : str
+        The path to the folder with measurements.csv and stations.csv
+    convert_kwargs :
+        Other arguments passed to convert_periodic_gwl
+
+    Returns
+    -------
+    dataframe
+        the measurements (site_code, msmt_date, gse_gwe, etc.) with the station
+        data and the hydrologic region
+    """
+
+    input_files = [os.path.join(input_folder, 'measurements.csv'), os.path.join(input_folder, 'stations.csv')]
+    if not is_current(os.path.join(folder, '_source.txt'), input_files):
+        convert_periodic_gwl(input_folder, output_folder = folder, partition_by = partition_by,
+                             **convert_kwargs)
+
+    filters = []
+    if regions is not None:
+        filters.append(('HR_NAME', 'in', list(regions)))
+    if years is not None:
+        filters.append(('year', 'in', [int(year) for year in years]))
+
+    gwdata = pd.read_parquet(folder, columns = columns,
+                             filters = filters if len(filters)>0 else None)
+
+    #The partition column is read as categorical: we return it with its
+    #original type to avoid empty groups in later groupbys
+    if 'HR_NAME' in gwdata.columns:
+        gwdata['HR_NAME'] = gwdata['HR_NAME'].astype(str)
+    if 'year' in gwdata.columns:
+        gwdata['year'] = gwdata['year'].astype(int)
+    return gwdata
+
+
+#Columns used from the well completion reports
+#Data from: https://data.cnra.ca.gov/dataset/well-completion-reports
+oswcr_columns = ['WCRNUMBER', 'DECIMALLONGITUDE', 'DECIMALLATITUDE',
+                 'TOTALCOMPLETEDDEPTH', 'DATEWORKENDED', 'PLANNEDUSEFORMERUSE']
+
+
+def convert_oswcr(input_file = '../../Data/Input_Data/groundwater/oswcr_bulkdatadownload/OSWCR.csv',
+                  welltype_file = '../../Data/Input_Data/groundwater/wellusetype.csv',
+                  hr_shapefile = '../../Data/Input_Data/HRs/i03_Hydrologic_Regions.shp',
+                  output_file = '../../Data/Processed/groundwater/oswcr_wells.parquet'):
+    """Converts the well completion reports into a typed well inventory
+    (parquet), with the supply type and the hydrologic region already added.
+    The file is written to a temporary file that then replaces the existing
+    one, and the stamp of the reports and the well types is written to
+    output_file.source (see is_current)
+
+    Parameters
+    ----------
+    input_file : str
+        The path to OSWCR.csv
+    welltype_file : str
+        The path to the csv that classifies PLANNEDUSEFORMERUSE into supplytype
+    hr_shapefile : str
+        The path to the hydrologic regions shapefile
+    output_file : str
+        The path to the parquet file that will be written
+
+    Returns
+    -------
+    dataframe
+        the well inventory, as written to disk
+    """
+
+    stamp = source_stamp([input_file, welltype_file])
+
+    #All the columns are read as text and typed once
+    wells = pd.read_csv(input_file, encoding = 'latin-1', usecols = oswcr_columns,
+                        dtype = 'str')
+    welltype = pd.read_csv(welltype_file, dtype = 'str')
+    wells = wells.merge(welltype[['PLANNEDUSEFORMERUSE', 'supplytype']], on = 'PLANNEDUSEFORMERUSE')
+
+    for column in ['DECIMALLONGITUDE', 'DECIMALLATITUDE', 'TOTALCOMPLETEDDEPTH']:
+        wells[column] = pd.to_numeric(wells[column], errors='coerce')
+    wells['date'] = pd.to_datetime(wells['DATEWORKENDED'], errors='coerce')
+    wells['year'] = wells['date'].dt.year
+    wells = wells.drop(columns = 'DATEWORKENDED')
+
+    #Adding hydrologic region (only wells within a region are kept)
+    wells = add_region_column(wells, lon_column = 'DECIMALLONGITUDE', lat_column = 'DECIMALLATITUDE',
+                              shapefile = hr_shapefile, name_column = 'HR_NAME', predicate = 'within')
+
+    wells = wells.sort_values(['supplytype', 'HR_NAME']).reset_index(drop=True)
+    #The stamp is removed first, so the file is converted again if this is
+    #interrupted
+    if os.path.exists(output_file + '.source'):
+        os.remove(output_file + '.source')
+    wells.to_parquet(output_file + '.tmp', compression = 'zstd', index = False, row_group_size = 100000)
+    os.replace(output_file + '.tmp', output_file)
+    with open(output_file + '.source', 'w') as file:
+        file.write(stamp)
+    return wells
+
+
+def load_oswcr(file = '../../Data/Processed/groundwater/oswcr_wells.parquet',
+               supplytype = 'domestic', regions = None, columns = None,
+               input_file = '../../Data/Input_Data/groundwater/oswcr_bulkdatadownload/OSWCR.csv',
+               welltype_file = '../../Data/Input_Data/groundwater/wellusetype.csv',
+               **convert_kwargs):
+    """Loads the typed well inventory, converting the well completion reports
+    first if the inventory does not exist or was converted from older reports
+    (or well types)
+
+    Parameters
+    ----------
+    file : str
+        The path to the parquet file
+    supplytype : str, optional
+        The supply type of the wells to load (for instance 'domestic'). If
+        None, all of them
+    regions : list, optional
+        Hydrologic regions (HR_NAME) to load. If None, all of them
+    columns : list, optional
+        Columns to load. If None, all of them
+    input_file : str
+        The path to OSWCR.csv
+    welltype_file : str
+        The path to the csv that classifies PLANNEDUSEFORMERUSE into supplytype
+    convert_kwargs :
+        Other arguments passed to convert_oswcr
+
+    Returns
+    -------
+    dataframe
+        the wells with WCRNUMBER, coordinates, TOTALCOMPLETEDDEPTH, date, year,
+        supplytype and HR_NAME
+    """
+
+    if not is_current(file + '.source', [input_file, welltype_file]):
+        convert_oswcr(input_file, welltype_file, output_file = file, **convert_kwargs)
+
+    filters = []
+    if supplytype is not None:
+        filters.append(('supplytype', '==', supplytype))
+    if regions is not None:
+        filters.append(('HR_NAME', 'in', list(regions)))
+    return pd.read_parquet(file, columns = columns,
+                           filters = filters if len(filters)>0 else None)
@@ -37,199 +37,60 @@ from rasterio.plot import show
 import pykrige.kriging_tools as kt
 from pykrige.ok import OrdinaryKriging
 from rasterio.transform import Affine
-
-
-
-#Data from: https://data.cnra.ca.gov/dataset/periodic-groundwater-level-measurements
-gwdata = pd.read_csv('../../Data/Input_Data/groundwater/periodic_gwl_bulkdatadownload/measurements.csv')
-stations = pd.read_csv('../../Data/Input_Data/groundwater/periodic_gwl_bulkdatadownload/stations.csv')
-
-#Adding hydrologic region to gwdata
-hr = gpd.read_file('../../Data/Input_Data/HRs/i03_Hydrologic_Regions.shp')
-hr = hr.to_crs('epsg:4326')
-stations_gdf = gpd.GeoDataFrame(stations, geometry=gpd.points_from_xy(stations.longitude, stations.latitude))
-stations_gdf = stations_gdf.set_crs('epsg:4326')
-stations_gdf = gpd.sjoin(stations_gdf, hr)
-
-#Mergind data with stations
-gwdata = gwdata.merge(stations_gdf, on='site_code')
-gwdata = gwdata.loc[gwdata.gse_gwe<300]
-
-
-#Well completion report data. Data from: https://data.cnra.ca.gov/dataset/well-completion-reports
-datawells = pd.read_csv('../../Data/Input_Data/groundwater/oswcr_bulkdatadownload/OSWCR.csv' , encoding = 'latin=1')
-welltype = pd.read_csv('../../Data/Input_Data/groundwater/wellusetype.csv')
-datawells = datawells.merge(welltype, on = 'PLANNEDUSEFORMERUSE')
-
-domesticwells = datawells.loc[datawells.supplytype == 'domestic']
-domesticwells['DECIMALLONGITUDE'] = pd.to_numeric(domesticwells['DECIMALLONGITUDE'],errors='coerce')
-domesticwells['DECIMALLATITUDE'] = pd.to_numeric(domesticwells['DECIMALLATITUDE'],errors='coerce')
-domesticwells['TOTALCOMPLETEDDEPTH'] = pd.to_numeric(domesticwells['TOTALCOMPLETEDDEPTH'],errors='coerce')
-domesticwells['date'] = pd.to_datetime(domesticwells['DATEWORKENDED'],errors='coerce')
-domesticwells['year'] = domesticwells['date'].dt.year
-
-
-domesticwells_gdf = gpd.GeoDataFrame(domesticwells, geometry=gpd.points_from_xy(domesticwells.DECIMALLONGITUDE, domesticwells.DECIMALLATITUDE))
-domesticwells_gdf = domesticwells_gdf.set_crs('epsg:4326')
-domesticwells_gdf = gpd.sjoin(domesticwells_gdf, hr, op = 'within')
-
-
-#Adding temporal data to stations
-gwdata['msmt_date'] = pd.to_datetime(gwdata['msmt_date'])
-gwdata['year']=gwdata['msmt_date'].dt.year
-gwdata['semester']=1
-gwdata.loc[gwdata['msmt_date'].dt.month>6,'semester']=2
-
-
-
-#Krigging from gw elevation data for HR and year
-def gw_krig(gwdata = gwdata, hr_name = 'San Joaquin River', yr_n = 2022, res = 0.01):
-    df = gwdata.loc[(gwdata.HR_NAME==hr_name)]
-    df = df.loc[(df.year==yr_n) & (df.semester==2)]
-    
-    hr_shp = hr.loc[hr.HR_NAME==hr_name]
-    #min_xhr, min_yhr, max_xhr, max_yhr = hr_shp.total_bounds
-    
-    gwelev_gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.longitude, df.latitude))
-    gwelev_gdf.crs = hr_shp.crs
-    min_xpt, min_ypt, max_xpt, max_ypt = gwelev_gdf.total_bounds
-    
-    # Horizontal and vertical cell counts should be the same
-    res = 0.01
-    XX_pk_krig = np.arange(min_xpt, max_xpt+res, res)
-    YY_pk_krig = np.arange(min_ypt, max_ypt+res, res)
-    
-    data_elevations = df[['longitude','latitude','gse_gwe']].reset_index(drop=True)
-    data_elevations = data_elevations.loc[data_elevations.gse_gwe>0].to_numpy()
-    
-    # Generate ordinary kriging object
-    OK = OrdinaryKriging(
-        data_elevations[:, 0],
-        data_elevations[:, 1],
-        data_elevations[:, 2],
-        variogram_model = "exponential",
-        verbose = False,
-        enable_plotting = False,
-    )
-    
-    try:
-        Z_pk_krig, sigma_squared_p_krig = OK.execute("grid", XX_pk_krig, YY_pk_krig)
-    except:
-        Z_pk_krig = np.nan
-    return Z_pk_krig
-
-raster_df = gw_krig()
-
-def obtain_cell_value(raster=raster_df , res=0.01, x_coord = -118, y_coord=36, min_xpt =-120, min_ypt=36, max_xpt=-118, max_ypt=40):
-    
-    min_lat = min_ypt - (res/2)
-    
-    min_lon = min_xpt - (res/2)
-    
-    cell_y = math.floor((y_coord - min_lat)/res)
-    cell_x = math.floor((x_coord - min_lon)/res)
-    
-    try:
-        return raster[cell_y,cell_x]
-    except:
-        return np.nan
-    
-def wells_at_risk(gwdata = gwdata, hr_name = 'San Joaquin River', yr_n = 2022, res = 0.01, well_df=domesticwells_gdf, raster=raster_df):
-    
-    df = gwdata.loc[(gwdata.HR_NAME==hr_name)]
-    df = df.loc[(df.year==yr_n) & (df.semester==2)]   
-    hr_shp = hr.loc[hr.HR_NAME==hr_name]
-    gwelev_gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.longitude, df.latitude))
-    gwelev_gdf.crs = hr_shp.crs
-    min_xpt, min_ypt, max_xpt, max_ypt = gwelev_gdf.total_bounds
-    
-    sel_wells = well_df
-    sel_wells = sel_wells.loc[sel_wells.HR_NAME == hr_name]
-
-    sel_wells = sel_wells.dropna(subset=['TOTALCOMPLETEDDEPTH'])
-    
-    sel_wells = sel_wells.loc[sel_wells.year<yr_n] #only the wells that were already completed
-    
-    sel_wells['gw_level'] = sel_wells.apply(lambda row : obtain_cell_value(raster,res,row['DECIMALLONGITUDE'],row['DECIMALLATITUDE'],min_xpt, min_ypt, max_xpt, max_ypt), axis = 1)
-    
-    sel_wells['failed'] = 0
-    sel_wells.loc[sel_wells.gw_level>sel_wells.TOTALCOMPLETEDDEPTH,'failed']=1
-    sel_wells['atrisk'] = 0
-    sel_wells.loc[sel_wells.gw_level > sel_wells.TOTALCOMPLETEDDEPTH - 30,'atrisk']=1
-    
-    return sel_wells
-
-#San Joaquin River wells
-sjr_wells_hist = []
-for yr in np.arange(1991,2023):
-    print(yr)
-    raster_df = gw_krig(hr_name = 'San Joaquin River', yr_n = yr)
-    sjr_wells_hist.append(wells_at_risk(hr_name = 'San Joaquin River', yr_n = yr))
-    
-    
-#San Joaquin River wells
-tulare_wells_hist = []
-for yr in np.arange(1991,2023):
-    print(yr)
-    raster_df = gw_krig(hr_name = 'Tulare Lake', yr_n = yr)
-    tulare_wells_hist.append(wells_at_risk(hr_name = 'Tulare Lake', yr_n = yr))
-
-
-counter = 0
-a = pd.DataFrame()
-b = pd.DataFrame()
-total_at_risk_sjr = []
-for yr in np.arange(1991,2023):
-    a = sjr_wells_hist[counter][['WCRNUMBER','atrisk']].reset_index(drop=True)
-    total_risk_sjr = total_at_risk_sjr.append(a.atrisk.sum())
-    a = a.rename(columns={'atrisk':'atrisk_'+str(yr)})
-    if counter == 0:
-        b = a
-    if counter>0:
-        b = b.merge(a, on =  'WCRNUMBER', how='outer')
-    counter = counter+1
-    
-counter = 0
-a = pd.DataFrame()
-b = pd.DataFrame()
-total_at_risk_tul = []
-for yr in np.arange(1991,2023):
-    a = tulare_wells_hist[counter][['WCRNUMBER','atrisk']].reset_index(drop=True)
-    total_risk_tul = total_at_risk_tul.append(a.atrisk.sum())
-    a = a.rename(columns={'atrisk':'atrisk_'+str(yr)})
-    if counter == 0:
-        b = a
-    if counter>0:
-        b = b.merge(a, on =  'WCRNUMBER', how='outer')
-    counter = counter+1
-
-
-
-
-#Function to export krigged data
-#Based on https://pygis.io/docs/e_interpolation.html
-def export_kde_raster(Z, res, min_x, max_x, min_y, max_y, proj, filename):
-    '''Export and save a kernel density raster.'''
-
-    # Get resolution
-    xres = res#(max_x - min_x) / len(XX)
-    yres = res#(max_y - min_y) / len(YY)
-
-    # Set transform
-    transform = Affine.translation(min_x - xres / 2, min_y - yres / 2) * Affine.scale(xres, yres)
-
-    # Export array as raster
-    with rasterio.open(
-            filename,
-            mode = "w",
-            driver = "GTiff",
-            height = Z.shape[0],
-            width = Z.shape[1],
-            count = 1,
-            dtype = Z.dtype,
-            crs = proj,
-            transform = transform,
-    ) as new_dataset:
-            new_dataset.write(Z, 1)
-
-
+from groundwater_data_ingest import load_periodic_gwl, load_oswcr
+from dry_wells_functions import run_statewide, well_risk_history, expected_dry_wells
+
+
+#The statewide run uses a process pool: the workers import this module again
+#(spawn/forkserver start methods), so the run only happens in the main process
+if __name__ == '__main__':
+
+    #Regions, years and semesters of the analysis (regions = None for all the
+    #hydrologic regions with enough monitoring points)
+    regions = None
+    years = np.arange(1991,2023)
+    semesters = [1, 2]
+
+    #Data from: https://data.cnra.ca.gov/dataset/periodic-groundwater-level-measurements
+    #The bulk download is converted once into a typed parquet dataset partitioned by
+    #hydrologic region (including the station data and HR_NAME)
+    gwdata = load_periodic_gwl(folder = '../../Data/Processed/groundwater/periodic_gwl_parquet/',
+                               regions = regions,
+                               input_folder = '../../Data/Input_Data/groundwater/periodic_gwl_bulkdatadownload/')
+    gwdata = gwdata.loc[gwdata.gse_gwe<300]
+
+
+    #Well completion report data. Data from: https://data.cnra.ca.gov/dataset/well-completion-reports
+    #The reports are converted once into a typed well inventory with the supply
+    #type and the hydrologic region
+    domesticwells = load_oswcr(file = '../../Data/Processed/groundwater/oswcr_wells.parquet',
+                               supplytype = 'domestic')
+
+
+    #Adding temporal data to stations (msmt_date and year come already parsed)
+    gwdata['semester']=1
+    gwdata.loc[gwdata['msmt_date'].dt.month>6,'semester']=2
+
+
+    #Statewide run: variograms fitted once per region and decade, dry-well jobs for
+    #each (region, year, semester) in parallel and kriged surfaces as multi-band
+    #Cloud-Optimized GeoTIFFs (they can be sampled with sample_geotiff and
+    #surface_band). Region-years with less than 10 measurements are skipped, and the
+    #time of each job is reported to budget the runs
+    statewide = run_statewide(gwdata, domesticwells, regions = regions, years = years,
+                              semesters = semesters, min_points = 10,
+                              output_folder = '../../Data/Processed/groundwater/statewide/')
+    wells_hist = statewide['wells']
+    print(statewide['timings'].groupby(['task', 'status']).seconds.agg(['count', 'sum', 'mean']))
+
+
+    #History of each well (sparse well x year matrix) and yearly number of wells
+    #at risk and failed by region (NaN for the skipped or failed region-years)
+    atrisk_history, atrisk_counts = well_risk_history(wells_hist, flag = 'atrisk',
+                                                      job_log = statewide['timings'])
+    failed_history, failed_counts = well_risk_history(wells_hist, flag = 'failed',
+                                                      job_log = statewide['timings'])
+
+    #Expected number of failed and at-risk wells (from the kriging variance) with
+    #90% confidence bands by region and year
+    expected_wells = expected_dry_wells(wells_hist, confidence = 0.9)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:40:21 2026
+
+@author: alvar
+"""
+
+import os
+import shutil
+import pandas as pd
+import numpy as np
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+
+def well_percentile(df, date_column = 'msmt_date', value_column = 'gse_gwe',
+                    station_id_column = 'stn_id', initial_date = '1990-01-01',
+                    end_date = '2023-05-01', subset = ['HR_NAME', ['Sacramento River']], 
+                    maxgwchange = 30, pctg_data_valid=0):
+    """TBD
+    
+    Parameters
+    ----------
+    df : dataframe
+        The input dataframe that has a datetime and a value column to obtain
+        the percentiles
+    date_column : str
+        The column label of the datetime column
+    value_column : str
+        The column label of the columns with the values
+    station_id_column : str
+        The column label of the id of the stations or wells
+    inpitial_date: str
+        The initial data to be included in the calculations. String in
+        datetime format
+    subset: list
+        A list that includes in the first place the column label to subset the
+        data, and in second place the field values used for the subset. For
+        instance, if we include ['HR_NAME', ['Sacramento River', 'South Coast']],
+        the dataframe should include a column called HR_NAME, and it will be
+        filtered only with the fields included in the second list (in this case
+        'Sacramento River' and 'South Coast'). It could also be by basin, and
+        select specific basins.
+        
+    Returns
+    -------
+    dataframe
+        the original dateframe adding the percentiles for the temporal period
+    """
+    
+    #First we filter the data with the initial subset and date
+    df[date_column] = pd.to_datetime(df[date_column])
+    if subset is not None:
+        df = df.loc[df[subset[0]].isin(subset[1])]
+    df = df.loc[df[date_column]>=initial_date]
+    df = df.loc[df[date_column]<=end_date]
+    #Filter out all the readings above 300 ft (potentially confined aquifers)
+    df = df.loc[df[value_column]<=300]
+    df[value_column] = -df[value_column]
+    
+    #We filter by semester
+    df['year']=df[date_column].dt.year
+    df['semester']=1
+    df.loc[df[date_column].dt.month>6,'semester']=2
+    
+    #Obtain median groundwater elevation by semester
+    dfsem = df.groupby([subset[0], station_id_column, 'year', 'semester']).median(numeric_only=True).reset_index()
+    dfsem['month']=3
+    dfsem.loc[dfsem.semester>1, 'month']=9
+    dfsem['day']=30
+    dfsem.loc[dfsem.semester==1,"day"]=31
+    dfsem['date'] = pd.to_datetime(dfsem[['year','month', 'day']])
+    
+    #Filter stations with less than the minimum number of readings. Rows are
+    #kept in the same order within each station so that the grouped
+    #operations below match the station-by-station results
+    dfsem = dfsem.sort_values(by=station_id_column, kind='mergesort')
+    nreadings = dfsem.groupby(station_id_column)[value_column].transform('count')
+    dfst = dfsem.loc[nreadings>(pctg_data_valid*2*(date.today().year - int(initial_date[0:4]) + 1))].copy() #We want max of 20% of empty
+    
+    dfst['gwchange'] = dfst.groupby(station_id_column)[value_column].diff(periods=2)
+    dfst.loc[(dfst.gwchange>maxgwchange) | (dfst.gwchange<-maxgwchange),
+             'gwchange']=np.nan
+    
+    #Percentile of gw elev annual change
+    dfst['pctl_gwchange'] = dfst.groupby(station_id_column).gwchange.rank(pct=True)
+    dfst['half_gwchange']=dfst.gwchange*0.5
+    dfst['cumgwchange'] = dfst.groupby(station_id_column).half_gwchange.cumsum()
+    dfst.loc[dfst['gwchange'].isna(),'cumgwchange']=np.nan
+    dfst['pctl_cumgwchange'] = dfst.groupby(station_id_column)['cumgwchange'].rank(pct=True)
+    
+    #Perentile of seasonal gw elevation
+    dfst['pctl_gwelev'] = dfst.groupby([station_id_column, 'semester'])[value_column].rank(pct=True)
+    
+    dfallst = dfst.sort_values(by=[station_id_column, 'date'], kind='mergesort')
+    dfallst = dfallst.reset_index(drop=True)
+    return dfallst
+
+#Names of the statistics used in the regional summaries
+stat_quantiles = {'median': 0.5, 'perc25': 0.25, 'perc75': 0.75}
+
+def regional_pctl_analysis(df, grouping_column='HR_NAME', stat = 'all',
+                           indicator_columns = ['year', 'semester', 'gse_gwe', 'gwchange',
+                                                'cumgwchange', 'pctl_gwchange',
+                                                'pctl_cumgwchange', 'pctl_gwelev']):
+    """Obtains regional statistics of the individual well indicators. All
+    the quantiles are computed in a single groupby pass
+    
+    Parameters
+    ----------
+    df : dataframe
+        The input dataframe comes from the output of the well_percentile function
+    grouping_column : str
+        The column label of the datetime column that is used to obtain the
+        statistics (it could be the hydrologic region or the basin)
+    stat : str or list
+        It can be the median (median), the 25th percentile (perc25) or the 75th
+        percentile (perc75), or all (obtaining the three of them). It can also
+        be a list of quantiles (for instance [0.1, 0.5, 0.9])
+    indicator_columns : list
+        The column labels of the indicators to summarize. Columns that are not
+        in df are ignored
+        
+    Returns
+    -------
+    dataframe
+        A summary with one row by statistic, group and date, including the
+        number of wells reporting (reporting2) and the percentiles of the
+        regional statistic (pctl_gwchange_corr and pctl_cumgwchange_corr)
+    """
+    if stat == 'all':
+        quantiles = list(stat_quantiles.values())
+    elif isinstance(stat, str):
+        quantiles = [stat_quantiles[stat]]
+    else:
+        quantiles = list(stat)
+    quantile_names = {q: name for name, q in stat_quantiles.items()}
+    
+    columns = [column for column in indicator_columns if column in df.columns]
+    grouped = df.groupby(['date', grouping_column])
+    result = grouped[columns].quantile(quantiles)
+    result.index = result.index.set_names('quantile', level=-1)
+    result = result.reset_index()
+    result['stat'] = [quantile_names.get(q, 'perc' + format(100*q, 'g')) for q in result['quantile']]
+    result = result.merge(grouped.size().rename('reporting2').reset_index(),
+                          on = ['date', grouping_column])
+    
+    #Percentiles of the regional statistic, ranked independently for each statistic
+    result[['pctl_gwchange_corr', 'pctl_cumgwchange_corr']] = result.groupby('stat')[
+        ['pctl_gwchange', 'pctl_cumgwchange']].rank(pct=True).to_numpy()
+    
+    result = result.drop(columns='quantile').sort_values(['stat', grouping_column, 'date'])
+    return result
+
+
+def _basin_well_percentile(df, basin_column, basins, kwargs):
+    #Worker for basin_pctl_analysis (module level so it can be pickled)
+    return well_percentile(df, subset = [basin_column, basins], **kwargs)
+
+def basin_pctl_analysis(df, basin_column = 'basin_name', basins = None, stat = 'all',
+                        n_jobs = None, output_folder = None, **kwargs):
+    """Obtains the groundwater indicators (pctl_gwchange_corr and
+    pctl_cumgwchange_corr) for every groundwater basin in one run. The
+    individual well percentiles are obtained in parallel by chunks of basins
+    
+    Parameters
+    ----------
+    df : dataframe
+        The input dataframe with the groundwater measurements (as in
+        well_percentile), including the basin column
+    basin_column : str
+        The column label of the basin (for instance basin_name or basin_code
+        from the stations data)
+    basins : list, optional
+        The basins to include. If None, all the basins in df
+    stat : str or list
+        The statistics used in regional_pctl_analysis
+    n_jobs : integer, optional
+        The number of processes. If None, the number of processors
+    output_folder : str, optional
+        If provided, the basin summary is written as a parquet dataset
+        partitioned by basin_column (replacing the previous one), so it can be
+        read by basin with read_basin_analysis
+    kwargs :
+        Other arguments passed to well_percentile
+        
+    Returns
+    -------
+    tuple
+        the individual well analysis and the basin summary
+    """
+    if basins is None:
+        basins = list(df[basin_column].dropna().unique())
+    df = df.loc[df[basin_column].isin(basins)]
+    
+    #Chunks of basins with similar number of measurements for each process
+    if n_jobs is None:
+        n_jobs = os.cpu_count()
+    basin_sizes = df[basin_column].value_counts()
+    chunks = [[] for _ in range(n_jobs)]
+    chunk_sizes = np.zeros(n_jobs)
+    for basin, size in basin_sizes.items():
+        chunk = chunk_sizes.argmin()
+        chunks[chunk].append(basin)
+        chunk_sizes[chunk] += size
+    chunks = [chunk for chunk in chunks if len(chunk)>0]
+    
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        jobs = [executor.submit(_basin_well_percentile,
+                                df.loc[df[basin_column].isin(chunk)],
+                                basin_column, chunk, kwargs) for chunk in chunks]
+        individual_analysis = pd.concat([job.result() for job in jobs]).reset_index(drop=True)
+    
+    basin_analysis = regional_pctl_analysis(individual_analysis, grouping_column=basin_column, stat=stat)
+    
+    if output_folder is not None:
+        #Written to a temporary folder that then replaces the previous summary
+        #(pyarrow adds files to the existing partitions instead of replacing
+        #them)
+        output_folder = os.path.normpath(output_folder)
+        temp_folder = output_folder + '.tmp'
+        if os.path.exists(temp_folder):
+            shutil.rmtree(temp_folder)
+        basin_analysis.to_parquet(temp_folder, partition_cols = [basin_column],
+                                  compression = 'zstd', index = False)
+        if os.path.exists(output_folder):
+            shutil.rmtree(output_folder)
+        os.rename(temp_folder, output_folder)
+    return individual_analysis, basin_analysis
+
+def read_basin_analysis(folder = '../../Data/Processed/groundwater/basin_wells_regional_analysis/',
+                        basins = None, basin_column = 'basin_name'):
+    """Reads the basin summary written by basin_pctl_analysis
+    
+    Parameters
+    ----------
+    folder : str
+        The path to the parquet dataset
+    basins : list, optional
+        The basins to read. If None, all of them
+    basin_column : str
+        The column label of the basin (the partition column)
+        
+    Returns
+    -------
+    dataframe
+        The basin summary for the selected basins
+    """
+    filters = None
+    if basins is not None:
+        filters = [(basin_column, 'in', list(basins))]
+    result = pd.read_parquet(folder, filters = filters)
+    result[basin_column] = result[basin_column].astype(str)
+    return result.sort_values(['stat', basin_column, 'date']).reset_index(drop=True)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:31:12 2026
+
+@author: alvar
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+import rasterio
+from rasterio.windows import Window
+
+
+def local_ordinary_kriging(OK, style, xpoints, ypoints, n_closest_points = 30,
+                           search_radius = np.inf, chunk_size = 5000):
+    """Moving-neighborhood ordinary kriging. Each point is estimated only with
+    the n closest measurements (found through a KD-tree) within the search
+    radius, using the variogram fitted in the OrdinaryKriging object. The
+    kriging systems are solved by chunks of points, so memory is bounded by
+    chunk_size * n_closest_points**2
+
+    Parameters
+    ----------
+    OK : OrdinaryKriging
+        The pykrige OrdinaryKriging object with the measurements and the fitted
+        variogram (euclidean coordinates, no anisotropy)
+    style : str
+        'grid' (xpoints and ypoints define a rectangular grid) or 'points'
+        (xpoints and ypoints are the coordinates of each point), as in
+        OrdinaryKriging.execute
+    xpoints : array
+        The x coordinates (longitude)
+    ypoints : array
+        The y coordinates (latitude)
+    n_closest_points : integer
+        The number of closest measurements used for each point
+    search_radius : float
+        The maximum distance (in the units of the coordinates) of the
+        measurements used. Points without measurements in the radius are NaN
+    chunk_size : integer
+        The number of points solved at once
+
+    Returns
+    -------
+    tuple
+        the kriged values and the kriging variance (with shape (len(ypoints),
+        len(xpoints)) for 'grid' and (len(xpoints),) for 'points')
+    """
+
+    xpoints = np.atleast_1d(np.asarray(xpoints, dtype='float64'))
+    ypoints = np.atleast_1d(np.asarray(ypoints, dtype='float64'))
+    if style == 'grid':
+        shape = (len(ypoints), len(xpoints))
+        xpoints, ypoints = [arr.ravel() for arr in np.meshgrid(xpoints, ypoints)]
+    elif style == 'points':
+        shape = xpoints.shape
+    else:
+        raise NameError("style has to be 'grid' or 'points'")
+
+    x = OK.X_ORIG
+    y = OK.Y_ORIG
+    z = OK.Z
+    variogram = OK.variogram_function
+    params = OK.variogram_model_parameters
+
+    tree = cKDTree(np.column_stack([x, y]))
+    k = min(n_closest_points, len(x))
+    diag = np.arange(k)
+
+    npt = len(xpoints)
+    zvalues = np.full(npt, np.nan)
+    sigmasq = np.full(npt, np.nan)
+    for start in range(0, npt, chunk_size):
+        end = min(start + chunk_size, npt)
+        dist, idx = tree.query(np.column_stack([xpoints[start:end], ypoints[start:end]]),
+                               k=k, distance_upper_bound=search_radius)
+        dist = dist.reshape(end - start, k)
+        idx = idx.reshape(end - start, k)
+        valid = np.isfinite(dist)
+        has_data = valid.any(axis=1)
+        idx = np.where(valid, idx, 0)
+
+        #Kriging matrices for each point. Missing neighbors (beyond the search
+        #radius) are decoupled from the system so they get zero weight
+        xn = x[idx]
+        yn = y[idx]
+        d = np.hypot(xn[:, :, None] - xn[:, None, :], yn[:, :, None] - yn[:, None, :])
+        pairs = valid[:, :, None] & valid[:, None, :]
+        a = np.zeros((end - start, k + 1, k + 1))
+        a[:, :k, :k] = np.where(pairs, -variogram(params, d), 0.0)
+        a[:, diag, diag] = np.where(valid, 0.0, 1.0)
+        a[:, k, :k] = valid
+        a[:, :k, k] = valid
+        a[~has_data, k, k] = 1.0
+
+        b = np.zeros((end - start, k + 1))
+        dist = np.where(valid, dist, 0.0)
+        b[:, :k] = np.where(valid & (dist > OK.eps), -variogram(params, dist), 0.0)
+        b[:, k] = 1.0
+
+        w = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+        zvalues[start:end] = np.where(has_data, np.sum(w[:, :k] * z[idx], axis=1), np.nan)
+        sigmasq[start:end] = np.where(has_data, np.sum(w * -b, axis=1), np.nan)
+
+    return zvalues.reshape(shape), sigmasq.reshape(shape)
+
+
+def krige_at_points(OK, xpoints, ypoints, n_closest_points = None,
+                    search_radius = np.inf, chunk_size = 5000):
+    """Kriging only at the given locations (for instance, domestic wells)
+    instead of a full grid. Repeated coordinates are kriged once
+
+    Parameters
+    ----------
+    OK : OrdinaryKriging
+        The pykrige OrdinaryKriging object with the fitted variogram
+    xpoints : array
+        The x coordinates (longitude) of the locations
+    ypoints : array
+        The y coordinates (latitude) of the locations
+    n_closest_points : integer, optional
+        If provided, moving-neighborhood kriging with the n closest
+        measurements (see local_ordinary_kriging). If None, all the
+        measurements are used
+    search_radius : float
+        The search radius for the moving-neighborhood kriging
+    chunk_size : integer
+        The number of locations solved at once
+
+    Returns
+    -------
+    tuple
+        the kriged values and the kriging variance at each location (NaN for
+        locations with missing coordinates)
+    """
+
+    xy = np.column_stack([np.asarray(xpoints, dtype='float64'), np.asarray(ypoints, dtype='float64')])
+    zvalues = np.full(len(xy), np.nan)
+    sigmasq = np.full(len(xy), np.nan)
+    valid = np.isfinite(xy).all(axis=1)
+    if not valid.any():
+        return zvalues, sigmasq
+
+    unique_xy, inverse = np.unique(xy[valid], axis=0, return_inverse=True)
+    if n_closest_points is None:
+        z_unique = np.empty(len(unique_xy))
+        s_unique = np.empty(len(unique_xy))
+        for start in range(0, len(unique_xy), chunk_size):
+            end = min(start + chunk_size, len(unique_xy))
+            z_chunk, s_chunk = OK.execute('points', unique_xy[start:end, 0], unique_xy[start:end, 1])
+            z_unique[start:end] = np.ma.filled(z_chunk, np.nan)
+            s_unique[start:end] = np.ma.filled(s_chunk, np.nan)
+    else:
+        z_unique, s_unique = local_ordinary_kriging(OK, 'points', unique_xy[:, 0], unique_xy[:, 1],
+                                                    n_closest_points = n_closest_points,
+                                                    search_radius = search_radius,
+                                                    chunk_size = chunk_size)
+
+    zvalues[valid] = z_unique[inverse.ravel()]
+    sigmasq[valid] = s_unique[inverse.ravel()]
+    return zvalues, sigmasq
+
+
+def sample_geotiff(filename, xpoints, ypoints, bands = 1):
+    """Samples a GeoTIFF at many locations at once, reading only the window
+    that contains the locations. Locations outside the raster (or with missing
+    coordinates) and nodata cells get NaN
+
+    Parameters
+    ----------
+    filename : str
+        The path to the GeoTIFF (for instance, the gw depth surfaces written by
+        dry_wells_functions.write_region_surfaces)
+    xpoints : array
+        The x coordinates of the locations (in the raster crs)
+    ypoints : array
+        The y coordinates of the locations (in the raster crs)
+    bands : integer or list
+        The band (or list of bands) to sample
+
+    Returns
+    -------
+    array
+        the values of each location (with shape (len(bands), n) if bands is a
+        list)
+    """
+    xpoints = np.asarray(xpoints, dtype='float64')
+    ypoints = np.asarray(ypoints, dtype='float64')
+    band_list = [bands] if np.ndim(bands) == 0 else list(bands)
+    values = np.full((len(band_list), len(xpoints)), np.nan)
+
+    with rasterio.open(filename) as src:
+        inverse = ~src.transform
+        cols = inverse.a*xpoints + inverse.b*ypoints + inverse.c
+        rows = inverse.d*xpoints + inverse.e*ypoints + inverse.f
+        with np.errstate(invalid='ignore'):
+            rows = np.floor(rows)
+            cols = np.floor(cols)
+        inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+        if inside.any():
+            rows = rows[inside].astype(int)
+            cols = cols[inside].astype(int)
+            row_off, col_off = rows.min(), cols.min()
+            window = Window(col_off, row_off, cols.max() - col_off + 1, rows.max() - row_off + 1)
+            data = src.read(band_list, window=window, masked=True).astype('float64').filled(np.nan)
+            values[:, inside] = data[:, rows - row_off, cols - col_off]
+
+    if np.ndim(bands) == 0:
+        return values[0]
+    return values
@@ -16,7 +16,7 @@ def func_for_tperiod(df, date_column = 'date', value_column = 'VALUE',
                      function = 'percentile', grouping_column=None,
                      correcting_no_reporting = False, correcting_column = 'capacity',
                      baseline_start_year = 1991, baseline_end_year = 2020,
-                     remove_zero = True):
+                     remove_zero = True, min_completeness = 1.0):
     
     
     """Obtains percentiles or averages for each time window (analysis
@@ -39,6 +39,8 @@ def func_for_tperiod(df, date_column = 'date', value_column = 'VALUE',
         or other functions. It can be:
             "1D": daily analysis
             "1W": weekly analysis
+            "USDM": weekly analysis in U.S. Drought Monitor weeks (ending on
+                    Tuesday), with a weekly baseline (same week of the year)
             "2W": two-week analysis (14 days)
             "1M": monthly analysis
             "2M": two-monthl analysis
@@ -63,6 +65,9 @@ def func_for_tperiod(df, date_column = 'date', value_column = 'VALUE',
         parameter indicates the beginning of the baseline
     baseline_end_year = to obtain percentiles with a fixed baseline, this
         parameter indicates the end of the baseline
+    min_completeness = the minimum fraction of the time steps of the analysis
+        period with data to obtain its average (by default 1: any missing time
+        step gives NaN)
     
     Returns
     -------
@@ -73,6 +78,7 @@ def func_for_tperiod(df, date_column = 'date', value_column = 'VALUE',
     #First we define a dictionary for combining the analysis_period and the input_timestep
     period_dict = {"1D": ['D', 1],
                    "1W": ['D', 7],
+                   "USDM": ['W', 1],
                    "2W": ['D', 14],
                    "1M": ['M', 1],
                    "2M": ['M', 2],
@@ -91,32 +97,38 @@ def func_for_tperiod(df, date_column = 'date', value_column = 'VALUE',
     if grouping_column is not None:
         df['reporting']=1
         df = df.groupby([grouping_column, date_column]).sum().reset_index()
-        if correcting_no_reporting == True:
-            df['percentage_of_reporting'] = df[value_column]/df[correcting_column]
             
     
     newdf = pd.DataFrame()
     for group in np.unique(df[grouping_column]):
         dfgroup = df.loc[df[grouping_column]==group]
     
-        if (period_dict[analysis_period][0] == "D") and (input_timestep == 'M'):
+        if (period_dict[analysis_period][0] in ["D", "W"]) and (input_timestep == 'M'):
             raise NameError('For the selected analysis_period, the input_timestep has to be daily (D)')
         elif (period_dict[analysis_period][0] == "D") and (input_timestep == 'D'):
             dfgroup = dfgroup.groupby(pd.Grouper(key=date_column, freq="1D")).mean().reset_index()
+        elif period_dict[analysis_period][0] == "W":
+            #Weeks ending on Tuesday (as the U.S. Drought Monitor)
+            dfgroup = dfgroup.groupby(pd.Grouper(key=date_column, freq="W-TUE")).mean().reset_index()
         else:
             dfgroup = dfgroup.groupby(pd.Grouper(key=date_column, freq="1M")).mean().reset_index()
             
         #Add a column with the average value for the period of analysis
-        dfgroup['value_period'] = dfgroup[value_column].rolling(period_dict[analysis_period][1]).mean(nan='Ignore')
+        window = period_dict[analysis_period][1]
+        dfgroup['value_period'] = dfgroup[value_column].rolling(window, min_periods=max(1, int(np.ceil(window*min_completeness)))).mean()
         dfgroup['month'] = pd.DatetimeIndex(dfgroup[date_column]).month
         if period_dict[analysis_period][0] == "M":
             dfgroup['day']=1
         elif period_dict[analysis_period][0] == "D":
             dfgroup['day'] = pd.DatetimeIndex(dfgroup[date_column]).day
+        elif period_dict[analysis_period][0] == "W":
+            #The weeks are compared with the same week of the year
+            dfgroup['month'] = 1
+            dfgroup['day'] = usdm_week(dfgroup[date_column])
         
         dfgroup[grouping_column]= group
         #Percentiles or averages
-        for monthnumber in np.arange(1,13):
+        for monthnumber in np.unique(dfgroup.month):
             for daynumber in np.unique(dfgroup.day):
                 dfmonth = dfgroup.loc[(dfgroup.month == monthnumber) & (dfgroup.day == daynumber)]
                 if function == 'percentile':
@@ -124,10 +136,6 @@ def func_for_tperiod(df, date_column = 'date', value_column = 'VALUE',
                         dfmonth_for_arr = dfmonth.loc[(dfmonth[date_column].dt.year>(baseline_start_year-1)) & (dfmonth[date_column].dt.year<(baseline_end_year+1))]
                         arr = dfmonth_for_arr['value_period']
                         dfmonth[function] = 0.01*stats.percentileofscore(arr, dfmonth['value_period'])
-                        if correcting_no_reporting==True:
-                            arr2 = dfmonth_for_arr['percentage_of_reporting']
-                            dfmonth['corrected_percentile'] = 0.01*stats.percentileofscore(arr2, dfmonth['percentage_of_reporting'])
-                            dfmonth['corrected_value'] = dfmonth['percentage_of_reporting'] * dfmonth.capacity.max()
                     else:
                         dfmonth[function] = dfmonth.value_period.rank(pct=True)
                 elif function == 'average':
@@ -135,10 +143,159 @@ def func_for_tperiod(df, date_column = 'date', value_column = 'VALUE',
                 newdf = pd.concat([newdf, dfmonth])
                 newdf = newdf.sort_values(by=date_column).reset_index(drop=True)
         
+    #Correction for stations not reporting (all groups and months at once)
+    if (correcting_no_reporting == True) and (function == 'percentile') and \
+       (baseline_start_year is not None) & (baseline_end_year is not None):
+        newdf = reporting_correction(newdf, grouping_column, date_column = date_column,
+                                     value_column = value_column, correcting_column = correcting_column,
+                                     slot = {'D': 'day', 'W': 'week', 'M': 'month'}[period_dict[analysis_period][0]],
+                                     baseline_start_year = baseline_start_year,
+                                     baseline_end_year = baseline_end_year)
+
     #Return result
     newdf['day'] = pd.DatetimeIndex(newdf[date_column]).day
+    if period_dict[analysis_period][0] == "W":
+        newdf['month'] = pd.DatetimeIndex(newdf[date_column]).month
+        newdf['week'] = usdm_week(newdf[date_column])
     if grouping_column is not None:
         newdf = newdf.sort_values(by = [grouping_column, date_column]).reset_index(drop=True)
     return newdf
         
         
+
+
+def usdm_week_end(dates):
+    #Week of each date as the U.S. Drought Monitor (weeks ending on Tuesday),
+    #dated at the Tuesday that ends the week
+    dates = pd.DatetimeIndex(dates).normalize()
+    return dates + pd.to_timedelta((1 - dates.weekday) % 7, unit='D')
+
+
+def usdm_week(week_end):
+    #Week of the year (1 to 52) of the weeks ending on week_end, used as the
+    #slot of the weekly baseline. The few weeks ending on the last day(s) of
+    #the year (week 53) are compared with week 52
+    week_end = pd.DatetimeIndex(week_end)
+    return np.minimum((np.asarray(week_end.dayofyear) - 1)//7 + 1, 52)
+
+
+def percentile_of_score(baseline_slots, baseline_values, slots, values):
+    """Vectorized scipy.stats.percentileofscore (kind='rank') of many values,
+    each one against the baseline values of its own slot (for instance, the
+    same group and calendar day). Missing baseline values are ignored
+
+    Parameters
+    ----------
+    baseline_slots : array
+        The integer slot of each baseline value
+    baseline_values : array
+        The baseline values
+    slots : array
+        The integer slot of each value
+    values : array
+        The values
+
+    Returns
+    -------
+    array
+        the percentile (0 to 1) of each value in the baseline of its slot (NaN
+        for missing values or slots without baseline)
+    """
+    baseline_slots = np.asarray(baseline_slots, dtype='int64')
+    baseline_values = np.asarray(baseline_values, dtype='float64')
+    slots = np.asarray(slots, dtype='int64')
+    values = np.asarray(values, dtype='float64')
+    valid = ~np.isnan(baseline_values)
+    baseline_slots, baseline_values = baseline_slots[valid], baseline_values[valid]
+
+    #Values replaced by their rank among all the values, so (slot, rank) can be
+    #searched in a single sorted integer key
+    unique_values = np.unique(baseline_values)
+    n_ranks = len(unique_values) + 1
+    baseline_keys = np.sort(baseline_slots*n_ranks + np.searchsorted(unique_values, baseline_values))
+    left_rank = np.searchsorted(unique_values, values, side='left')
+    right_rank = np.searchsorted(unique_values, values, side='right')
+
+    slot_start = np.searchsorted(baseline_keys, slots*n_ranks, side='left')
+    slot_count = np.searchsorted(baseline_keys, (slots + 1)*n_ranks, side='left') - slot_start
+    left = np.searchsorted(baseline_keys, slots*n_ranks + left_rank, side='left') - slot_start
+    right = np.searchsorted(baseline_keys, slots*n_ranks + right_rank, side='left') - slot_start
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentile = 0.5*(left + right + (right>left))/slot_count
+    percentile[(slot_count==0) | np.isnan(values)] = np.nan
+    return percentile
+
+
+def reporting_correction(df, grouping_column, date_column = 'date', value_column = 'value',
+                         correcting_column = 'capacity', slot = 'month',
+                         baseline_start_year = 1991, baseline_end_year = 2020):
+    """Correction of the aggregated storage for stations not reporting, for all
+    the groups and dates at once. The storage is divided by the capacity of the
+    stations reporting (percentage_of_reporting) and applied to the maximum
+    capacity reporting in the same group and calendar month (or day)
+    (corrected_value). The percentile of percentage_of_reporting in that
+    calendar slot of the baseline is the corrected_percentile, and the ratio
+    between the capacity reporting and the maximum capacity is the
+    reporting_coverage (low values show months with few stations reporting)
+
+    Parameters
+    ----------
+    df : dataframe
+        The aggregated storage of each group and date, with the capacity of the
+        stations reporting
+    grouping_column : str
+        The column label of the groups
+    date_column : str
+        The column label of the dates
+    value_column : str
+        The column label of the storage
+    correcting_column : str
+        The column label of the capacity reporting
+    slot : str
+        'month' (calendar months), 'day' (calendar days, with February 29 in
+        the February 28 slot) or 'week' (weeks of the year, for the weeks
+        ending on Tuesday, see usdm_week)
+    baseline_start_year : integer
+        The first year of the baseline of the corrected percentiles
+    baseline_end_year : integer
+        The last year of the baseline of the corrected percentiles
+
+    Returns
+    -------
+    dataframe
+        the original dataframe adding percentage_of_reporting,
+        corrected_value, corrected_percentile and reporting_coverage
+    """
+    df = df.copy()
+    dates = pd.DatetimeIndex(df[date_column])
+    group_codes, _ = pd.factorize(df[grouping_column])
+    if slot == 'month':
+        slots = group_codes*13 + dates.month
+    elif slot == 'day':
+        day = np.where((dates.month==2) & (dates.day==29), 28, dates.day)
+        slots = group_codes*1300 + dates.month*100 + day
+    elif slot == 'week':
+        slots = group_codes*53 + usdm_week(dates)
+    else:
+        raise NameError("slot has to be 'month', 'day' or 'week'")
+    slots = np.asarray(slots, dtype='int64')
+
+    df['percentage_of_reporting'] = df[value_column]/df[correcting_column]
+    max_capacity = df[correcting_column].groupby(slots).transform('max').to_numpy()
+    df['corrected_value'] = df['percentage_of_reporting'] * max_capacity
+    df['reporting_coverage'] = df[correcting_column] / max_capacity
+
+    baseline = np.asarray((dates.year>=baseline_start_year) & (dates.year<=baseline_end_year))
+    fraction = df['percentage_of_reporting'].to_numpy(dtype='float64')
+    df['corrected_percentile'] = percentile_of_score(slots[baseline], fraction[baseline], slots, fraction)
+    return df
+
+
+def low_coverage_months(df, grouping_column, date_column = 'date', min_coverage = 0.8):
+    #Groups and dates with a reporting_coverage (see reporting_correction)
+    #lower than min_coverage
+    low = df.loc[df.reporting_coverage<min_coverage]
+    columns = [column for column in [grouping_column, date_column, 'n_reporting', 'reporting_coverage']
+               if column in low.columns]
+    return low[columns].sort_values([grouping_column, date_column]).reset_index(drop=True)
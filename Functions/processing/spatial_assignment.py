@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:02:15 2026
+
+@author: alvar
+"""
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.strtree import STRtree
+from scipy.spatial import cKDTree
+
+
+#Polygon layers used to assign regions to points (the name column is the
+#column added to the points)
+polygon_layers = {'HR_NAME': '../../Data/Input_Data/HRs/i03_Hydrologic_Regions.shp',
+                  'Basin_Name': '../../Data/Input_Data/B118/i08_B118_CA_GroundwaterBasins.shp',
+                  'NAME': '../../Data/Input_Data/Counties/CA_Counties.shp'}
+
+#STRtrees already built in this session, by shapefile and name column
+_polygon_indexes = {}
+
+
+def build_polygon_index(shapefile = polygon_layers['HR_NAME'], name_column = 'HR_NAME'):
+    """Reads a polygon layer and builds an STRtree over its polygons. The
+    index is built once per session and reused in later calls
+
+    Parameters
+    ----------
+    shapefile : str
+        The path to the polygon shapefile (hydrologic regions, Bulletin 118
+        basins, counties...)
+    name_column : str
+        The column label of the polygon names
+
+    Returns
+    -------
+    tuple
+        the array with the polygon names and the STRtree
+    """
+
+    key = (shapefile, name_column)
+    if key not in _polygon_indexes:
+        polygons = gpd.read_file(shapefile).to_crs('epsg:4326')
+        polygons = polygons.dropna(subset=[name_column]).reset_index(drop=True)
+        names = polygons[name_column].to_numpy()
+        geometries = polygons.geometry.to_numpy()
+        _polygon_indexes[key] = (names, STRtree(geometries))
+    return _polygon_indexes[key]
+
+
+def layer_stamp(shapefile):
+    #Path, size and modification time of the files of a shapefile (geometries,
+    #attributes, index and projection), without reading it
+    stamp = [os.path.abspath(shapefile)]
+    root, _ = os.path.splitext(shapefile)
+    for extension in ['.shp', '.dbf', '.shx', '.prj']:
+        if os.path.exists(root + extension):
+            stamp.append(extension + ' ' + str(os.path.getsize(root + extension)) + ' ' +
+                         repr(os.path.getmtime(root + extension)))
+    return '|'.join(stamp)
+
+
+def assign_points(lon, lat, shapefile = polygon_layers['HR_NAME'],
+                  name_column = 'HR_NAME', predicate = 'intersects'):
+    """Assigns the polygon name to each point in bulk using the STRtree
+
+    Parameters
+    ----------
+    lon : array
+        The longitude of the points (epsg:4326)
+    lat : array
+        The latitude of the points (epsg:4326)
+    shapefile : str
+        The path to the polygon shapefile
+    name_column : str
+        The column label of the polygon names
+    predicate : str
+        The spatial predicate, as in gpd.sjoin ('intersects' or 'within')
+
+    Returns
+    -------
+    array
+        the name of the polygon of each point (None if the point is not in
+        any polygon). If a point is in more than one polygon, the first one
+        is used
+    """
+
+    names, tree = build_polygon_index(shapefile, name_column)
+    points = shapely.points(np.asarray(lon, dtype='float64'), np.asarray(lat, dtype='float64'))
+    point_idx, polygon_idx = tree.query(points, predicate=predicate)
+
+    #Keep the first polygon (in layer order) for each point
+    order = np.lexsort((polygon_idx, point_idx))
+    point_idx, polygon_idx = point_idx[order], polygon_idx[order]
+    point_idx, first = np.unique(point_idx, return_index=True)
+
+    assigned = np.full(len(points), None, dtype=object)
+    assigned[point_idx] = names[polygon_idx[first]]
+    return assigned
+
+
+def assign_points_cached(df, lon_column = 'longitude', lat_column = 'latitude',
+                         shapefile = polygon_layers['HR_NAME'], name_column = 'HR_NAME',
+                         predicate = 'intersects',
+                         cache_folder = '../../Data/Processed/spatial_assignment/'):
+    """Same as assign_points for the coordinates of a dataframe, but the
+    assignments are stored on disk keyed by a hash of the coordinates, the
+    polygon layer (path, size and modification time of its files, see
+    layer_stamp), the name column and the predicate. Later runs with the same
+    inputs read the stored assignments without reading the layer or building
+    its index
+
+    Parameters
+    ----------
+    df : dataframe
+        The input dataframe with the coordinates of the points
+    lon_column : str
+        The column label of the longitude
+    lat_column : str
+        The column label of the latitude
+    shapefile : str
+        The path to the polygon shapefile
+    name_column : str
+        The column label of the polygon names
+    predicate : str
+        The spatial predicate ('intersects' or 'within')
+    cache_folder : str
+        The path to the folder where the assignments are stored
+
+    Returns
+    -------
+    series
+        the polygon name of each row, with the index of df
+    """
+
+    coordinates = df[[lon_column, lat_column]].astype('float64')
+    key = hashlib.sha1()
+    key.update(pd.util.hash_pandas_object(coordinates, index=False).to_numpy().tobytes())
+    key.update(layer_stamp(shapefile).encode())
+    key.update(name_column.encode())
+    key.update(predicate.encode())
+    filename = os.path.join(cache_folder, name_column + '_' + key.hexdigest() + '.parquet')
+
+    if os.path.exists(filename):
+        assigned = pd.read_parquet(filename)[name_column].to_numpy()
+    else:
+        assigned = assign_points(coordinates[lon_column], coordinates[lat_column],
+                                 shapefile, name_column, predicate)
+        os.makedirs(cache_folder, exist_ok=True)
+        pd.DataFrame({name_column: assigned}).to_parquet(filename, index=False)
+    return pd.Series(assigned, index=df.index, name=name_column)
+
+
+def add_region_column(df, lon_column = 'longitude', lat_column = 'latitude',
+                      shapefile = polygon_layers['HR_NAME'], name_column = 'HR_NAME',
+                      predicate = 'intersects',
+                      cache_folder = '../../Data/Processed/spatial_assignment/'):
+    """Adds the polygon name column to a dataframe of points, keeping only the
+    points inside a polygon (like an inner gpd.sjoin)
+
+    Parameters
+    ----------
+    As in assign_points_cached
+
+    Returns
+    -------
+    dataframe
+        the original dataframe (only points inside a polygon) with the name_column
+    """
+
+    df = df.copy()
+    df[name_column] = assign_points_cached(df, lon_column, lat_column, shapefile,
+                                           name_column, predicate, cache_folder)
+    return df.loc[df[name_column].notna()]
+
+
+#Point layers (gages, reservoirs and wells) for the nearest point and
+#within-polygon queries: file, id column and coordinate columns (epsg:4326)
+point_layers = {'gages': {'file': '../../Data/Processed/usgs/streamflow_sites.parquet',
+                          'id_column': 'site_no', 'lon_column': 'lon', 'lat_column': 'lat'},
+                'reservoirs': {'file': '../../Data/Input_Data/cdec/reservoirstations_hrs.csv',
+                               'id_column': 'ID', 'lon_column': 'Longitude', 'lat_column': 'Latitude'},
+                'wells': {'file': '../../Data/Processed/groundwater/oswcr_wells.parquet',
+                          'id_column': 'WCRNUMBER', 'lon_column': 'DECIMALLONGITUDE',
+                          'lat_column': 'DECIMALLATITUDE'}}
+
+#Point indexes already built in this session, by layer
+_point_indexes = {}
+
+earth_radius_km = 6371.0088
+
+
+def unit_vectors(lon, lat):
+    #3D coordinates of the points on the unit sphere: the straight-line
+    #distance between them increases with the great-circle distance, so a
+    #KD-tree finds the nearest points without projecting
+    lon = np.radians(np.asarray(lon, dtype='float64'))
+    lat = np.radians(np.asarray(lat, dtype='float64'))
+    return np.column_stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+
+
+def build_point_index(df, id_column, lon_column, lat_column):
+    """Builds the indexes of a point layer: a KD-tree over the points (for the
+    nearest points) and an STRtree (for the points within polygons). Points
+    without coordinates are not indexed
+
+    Parameters
+    ----------
+    df : dataframe
+        The points
+    id_column : str
+        The column label of the point ids (site_no, station ID, WCRNUMBER...)
+    lon_column : str
+        The column label of the longitude (epsg:4326)
+    lat_column : str
+        The column label of the latitude (epsg:4326)
+
+    Returns
+    -------
+    dict
+        the point ids, coordinates, KD-tree and STRtree
+    """
+
+    df = df.loc[df[lon_column].notna() & df[lat_column].notna()]
+    lon = df[lon_column].to_numpy(dtype='float64')
+    lat = df[lat_column].to_numpy(dtype='float64')
+    return {'ids': np.asarray(df[id_column]),
+            'lon': lon,
+            'lat': lat,
+            'kdtree': cKDTree(unit_vectors(lon, lat)),
+            'strtree': STRtree(shapely.points(lon, lat))}
+
+
+def load_point_index(layer = 'gages'):
+    """Reads a point layer (see point_layers) and builds its indexes. The
+    indexes are built once per session and reused in later calls
+
+    Parameters
+    ----------
+    layer : str
+        'gages', 'reservoirs' or 'wells'
+
+    Returns
+    -------
+    dict
+        the point indexes, as in build_point_index
+    """
+
+    if layer not in _point_indexes:
+        settings = point_layers[layer]
+        columns = [settings['id_column'], settings['lon_column'], settings['lat_column']]
+        if settings['file'].endswith('.parquet'):
+            points = pd.read_parquet(settings['file'], columns = columns)
+        else:
+            points = pd.read_csv(settings['file'], usecols = columns)
+        _point_indexes[layer] = build_point_index(points, *columns)
+    return _point_indexes[layer]
+
+
+def nearest_points(index, lon, lat, k = 5, max_distance = None):
+    """Finds the k nearest points of the index to each location, for all the
+    locations at once
+
+    Parameters
+    ----------
+    index : dict
+        The point indexes (from build_point_index or load_point_index)
+    lon : array
+        The longitude of the locations (epsg:4326)
+    lat : array
+        The latitude of the locations (epsg:4326)
+    k : integer
+        The number of nearest points
+    max_distance : float, optional
+        The maximum great-circle distance (km). If None, no limit
+
+    Returns
+    -------
+    tuple
+        the ids of the nearest points (locations x k, None if there are less
+        than k points within max_distance) and their great-circle distances in
+        km (NaN if there is no point)
+    """
+
+    upper_bound = np.inf
+    if max_distance is not None:
+        upper_bound = 2*np.sin(min(max_distance/earth_radius_km, np.pi)/2)
+    chord, position = index['kdtree'].query(unit_vectors(lon, lat), k = k,
+                                            distance_upper_bound = upper_bound)
+    chord, position = chord.reshape(-1, k), position.reshape(-1, k)
+
+    #The KD-tree returns the number of points as position if there is no point
+    missing = position==len(index['ids'])
+    ids = np.asarray(index['ids'], dtype=object)[np.where(missing, 0, position)]
+    ids[missing] = None
+    distances = 2*earth_radius_km*np.arcsin(np.minimum(chord, 2)/2)
+    distances[missing] = np.nan
+    return ids, distances
+
+
+def nearest_values(index, values, lon, lat, k = 5, max_distance = None, function = 'median'):
+    """Median (or mean) of the values of the k nearest points to each location,
+    for instance the percentile of the 5 gages nearest each supplier
+
+    Parameters
+    ----------
+    index : dict
+        The point indexes (from build_point_index or load_point_index)
+    values : series or dataframe
+        The values by point id (a series), or a dates x point ids dataframe
+    lon, lat : array
+        The coordinates of the locations (epsg:4326)
+    k : integer
+        The number of nearest points
+    max_distance : float, optional
+        The maximum great-circle distance (km). If None, no limit
+    function : str
+        'median' or 'mean' (ignoring missing values)
+
+    Returns
+    -------
+    array
+        the value of each location (or dates x locations), NaN if none of the
+        nearest points has a value
+    """
+
+    ids, _ = nearest_points(index, lon, lat, k, max_distance)
+    if isinstance(values, pd.Series):
+        matrix, point_ids = values.to_numpy(dtype='float64')[None, :], values.index
+    else:
+        matrix, point_ids = values.to_numpy(dtype='float64'), values.columns
+    position = pd.Index(point_ids).get_indexer(ids.ravel())
+
+    nearest = matrix[:, np.where(position>=0, position, 0)]
+    nearest[:, position<0] = np.nan
+    nearest = nearest.reshape(matrix.shape[0], ids.shape[0], k)
+    if function not in ['median', 'mean']:
+        raise NameError("function has to be 'median' or 'mean'")
+    with np.errstate(all='ignore'):
+        summary = np.nanmedian(nearest, axis=2) if function == 'median' else np.nanmean(nearest, axis=2)
+    return summary[0] if isinstance(values, pd.Series) else summary
+
+
+def points_within(index, polygons, predicate = 'intersects'):
+    """Finds the points of the index within each polygon, for all the polygons
+    at once
+
+    Parameters
+    ----------
+    index : dict
+        The point indexes (from build_point_index or load_point_index)
+    polygons : array or geoseries
+        The polygons (epsg:4326), for instance supplier service areas
+    predicate : str
+        The spatial predicate, from the polygons to the points ('intersects'
+        keeps points on the boundary, as gpd.clip; 'contains' does not)
+
+    Returns
+    -------
+    dataframe
+        one row per polygon (position in polygons) and point id within it
+    """
+
+    if isinstance(polygons, gpd.GeoSeries):
+        polygons = polygons.to_crs('epsg:4326').to_numpy()
+    polygon_idx, point_idx = index['strtree'].query(np.asarray(polygons), predicate = predicate)
+    return pd.DataFrame({'polygon': polygon_idx, 'id': index['ids'][point_idx]})
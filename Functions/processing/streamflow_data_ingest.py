@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 27 08:47:31 2026
+
+@author: alvar
+"""
+
+import os
+import glob
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+#Columns (and types) used from the daily streamflow download (written by
+#data_download_usgs.py with every column of the gage list and an index column)
+streamflow_columns = {'00060_Mean': 'float64',
+                      '00060_Mean_cd': 'str',
+                      'site_no': 'str',
+                      'lat': 'float64',
+                      'lon': 'float64',
+                      'HR_NAME': 'str'}
+site_columns = ['site_no', 'HR_NAME', 'lat', 'lon']
+
+
+def source_stamp(input_file):
+    #Size and modification time of the download converted into a dataset
+    return str(os.path.getsize(input_file)) + ' ' + repr(os.path.getmtime(input_file))
+
+
+def streamflow_is_current(input_file = '../../Data/Downloaded/usgs/streamflow_daily_data.csv',
+                          folder = '../../Data/Processed/usgs/streamflow_daily_parquet/',
+                          sites_file = '../../Data/Processed/usgs/streamflow_sites.parquet'):
+    #True if the dataset and the gages exist and were converted from the
+    #current download (the stamp of the download is stored in the dataset).
+    #If the download does not exist, the existing dataset is used. Gages
+    #without the date of their last daily value (converted before the
+    #provisional streamflow) are converted again
+    stamp_file = os.path.join(folder, '_source.txt')
+    if not (os.path.exists(stamp_file) and os.path.exists(sites_file)):
+        return False
+    if 'last_dv_date' not in pq.read_schema(sites_file).names:
+        return False
+    if not os.path.exists(input_file):
+        return True
+    with open(stamp_file) as file:
+        return file.read().strip() == source_stamp(input_file)
+
+
+def convert_daily_streamflow(input_file = '../../Data/Downloaded/usgs/streamflow_daily_data.csv',
+                             output_folder = '../../Data/Processed/usgs/streamflow_daily_parquet/',
+                             sites_file = '../../Data/Processed/usgs/streamflow_sites.parquet',
+                             chunksize = 1000000, provisional_file = None):
+    """Converts the daily streamflow download into a parquet dataset with one
+    partition per gage, reading the csv in chunks so the whole file is never
+    in memory. Only the needed columns are read, with their types and parsing
+    the dates while reading. The dataset is written to a temporary folder and
+    then replaces the existing dataset, so an interrupted conversion never
+    leaves a partial dataset. Provisional daily means from the instantaneous
+    values can be added after the last daily value of each gage (see
+    update_provisional_streamflow)
+
+    Parameters
+    ----------
+    input_file : str
+        The path to streamflow_daily_data.csv
+    output_folder : str
+        The path to the parquet dataset that will be written (partitioned by
+        site_no)
+    sites_file : str
+        The path to the parquet file with the gages (site_no, HR_NAME, lat and
+        lon) that will be written
+    chunksize : integer
+        The number of rows read (and written) at a time
+    provisional_file : str, optional
+        The path to the provisional daily streamflow (from download_usgs_iv.py).
+        If None, only the daily values are converted
+
+    Returns
+    -------
+    dataframe
+        the gages with the date of their last daily value (last_dv_date), as
+        written to sites_file
+    """
+    output_folder = os.path.normpath(output_folder)
+    temp_folder = output_folder + '.tmp'
+    temp_sites_file = sites_file + '.tmp'
+    if os.path.exists(temp_folder):
+        shutil.rmtree(temp_folder)
+    os.makedirs(temp_folder)
+    stamp = source_stamp(input_file)
+
+    sites = []
+    reader = pd.read_csv(input_file, usecols = list(streamflow_columns) + ['datetime'],
+                         dtype = streamflow_columns, chunksize = chunksize)
+    for chunk in reader:
+        #Daily values are dated at midnight (UTC if the dates have time zone)
+        chunk['datetime'] = pd.to_datetime(chunk['datetime'], utc = True).dt.tz_localize(None)
+        chunk = chunk.dropna(subset = ['site_no', 'datetime'])
+        if len(chunk)==0:
+            continue
+        chunk_sites = chunk.groupby('site_no').datetime.max().rename('last_dv_date')
+        sites.append(chunk[site_columns].drop_duplicates('site_no').merge(chunk_sites, on='site_no'))
+        chunk.to_parquet(temp_folder, partition_cols = ['site_no'],
+                         compression = 'zstd', index = False)
+
+    #A gage can be in more than one chunk
+    sites = pd.concat(sites)
+    last_dv_date = sites.groupby('site_no').last_dv_date.max()
+    sites = sites.drop_duplicates('site_no').drop(columns='last_dv_date').merge(last_dv_date, on='site_no')
+    sites = sites.sort_values('site_no').reset_index(drop=True)
+    sites.to_parquet(temp_sites_file, compression = 'zstd', index = False)
+
+    if provisional_file is not None:
+        update_provisional_streamflow(provisional_file, folder = temp_folder, sites_file = temp_sites_file)
+        sites = pd.read_parquet(temp_sites_file)
+
+    #Download the dataset was converted from (files starting with _ are not
+    #read as data)
+    with open(os.path.join(temp_folder, '_source.txt'), 'w') as file:
+        file.write(stamp)
+    #The new dataset replaces the old one (without the stamp until the end, so
+    #it is converted again if this is interrupted)
+    if os.path.exists(output_folder):
+        shutil.rmtree(output_folder)
+    os.replace(temp_sites_file, sites_file)
+    os.rename(temp_folder, output_folder)
+    return sites
+
+
+def reconcile_provisional(provisional, sites):
+    #Provisional daily means of the days after the last daily value of each
+    #gage (all of them for gages without daily values): the approved (or
+    #provisional) daily values published by USGS replace the means from the
+    #instantaneous values
+    provisional = provisional.merge(sites[['site_no', 'last_dv_date']], on='site_no', how='left')
+    newer = provisional.last_dv_date.isna() | (provisional.datetime>provisional.last_dv_date)
+    return provisional.loc[newer].drop(columns='last_dv_date').reset_index(drop=True)
+
+
+def update_provisional_streamflow(provisional_file = '../../Data/Downloaded/usgs/streamflow_provisional_daily.csv',
+                                  folder = '../../Data/Processed/usgs/streamflow_daily_parquet/',
+                                  sites_file = '../../Data/Processed/usgs/streamflow_sites.parquet'):
+    """Replaces the provisional daily streamflow of the parquet dataset with
+    the days of provisional_file after the last daily value of each gage. It
+    can be run every day without converting the daily values again
+
+    Parameters
+    ----------
+    provisional_file : str
+        The path to the provisional daily streamflow (from download_usgs_iv.py)
+    folder : str
+        The path to the parquet dataset (from convert_daily_streamflow)
+    sites_file : str
+        The path to the parquet file with the gages
+
+    Returns
+    -------
+    dataframe
+        the provisional daily streamflow added to the dataset
+    """
+    sites = pd.read_parquet(sites_file)
+    if 'last_dv_date' not in sites.columns:
+        raise ValueError(sites_file + ' has no last_dv_date: convert the daily streamflow again '
+                         '(convert_daily_streamflow)')
+    for file in glob.glob(os.path.join(folder, 'site_no=*', 'provisional-*.parquet')):
+        os.remove(file)
+
+    provisional = pd.read_csv(provisional_file, usecols = list(streamflow_columns) + ['datetime'],
+                              dtype = streamflow_columns, parse_dates = ['datetime'])
+    provisional = reconcile_provisional(provisional.dropna(subset = ['site_no', 'datetime']), sites)
+    if len(provisional)>0:
+        provisional.to_parquet(folder, partition_cols = ['site_no'], compression = 'zstd',
+                               index = False, basename_template = 'provisional-{i}.parquet')
+
+    #Gages with provisional data only are added to the gages
+    new_sites = provisional.loc[~provisional.site_no.isin(sites.site_no), site_columns].drop_duplicates('site_no')
+    if len(new_sites)>0:
+        sites = pd.concat([sites, new_sites]).sort_values('site_no').reset_index(drop=True)
+        sites.to_parquet(sites_file, compression = 'zstd', index = False)
+    return provisional
+
+
+def load_daily_streamflow(folder = '../../Data/Processed/usgs/streamflow_daily_parquet/',
+                          sites = None, columns = None, provisional_file = None,
+                          sites_file = '../../Data/Processed/usgs/streamflow_sites.parquet',
+                          input_file = '../../Data/Downloaded/usgs/streamflow_daily_data.csv',
+                          **convert_kwargs):
+    """Loads the daily streamflow from the parquet dataset, converting the
+    download first if the dataset does not exist or was converted from an
+    older download. The provisional daily streamflow is updated first if
+    provisional_file is given
+
+    Parameters
+    ----------
+    folder : str
+        The path to the parquet dataset
+    sites : list, optional
+        Gages (site_no) to load. If None, all of them
+    columns : list, optional
+        Columns to load (of datetime, 00060_Mean, 00060_Mean_cd, site_no, lat,
+        lon and HR_NAME). If None, all of them
+    provisional_file : str, optional
+        The path to the provisional daily streamflow (from download_usgs_iv.py),
+        added after the last daily value of each gage. If None (or if the file
+        does not exist), the provisional streamflow of the dataset is not
+        updated
+    sites_file : str
+        The path to the parquet file with the gages
+    input_file : str
+        The path to streamflow_daily_data.csv
+    convert_kwargs :
+        Other arguments passed to convert_daily_streamflow
+
+    Returns
+    -------
+    dataframe
+        the daily streamflow, with site_no as categorical (one code per gage
+        instead of one string per row)
+    """
+
+    if not streamflow_is_current(input_file, folder, sites_file):
+        convert_daily_streamflow(input_file, output_folder = folder, sites_file = sites_file, **convert_kwargs)
+    if (provisional_file is not None) and os.path.exists(provisional_file):
+        update_provisional_streamflow(provisional_file, folder = folder, sites_file = sites_file)
+
+    filters = None
+    if sites is not None:
+        filters = [('site_no', 'in', [str(site) for site in sites])]
+    #site_no is read as text (inferred from the partition names it would be an
+    #integer, losing the leading zeros of USGS site numbers)
+    partitioning = ds.partitioning(pa.schema([('site_no', pa.dictionary(pa.int32(), pa.string()))]),
+                                   flavor = 'hive', dictionaries = 'infer')
+    sflow_data = pd.read_parquet(folder, columns = columns, filters = filters,
+                                 partitioning = partitioning)
+
+    #The partition column is read as categorical with every gage of the
+    #dataset: unused gages are removed to avoid empty groups
+    if 'site_no' in sflow_data.columns:
+        sflow_data['site_no'] = sflow_data['site_no'].cat.remove_unused_categories()
+    return sflow_data
+
+
+def load_streamflow_sites(file = '../../Data/Processed/usgs/streamflow_sites.parquet',
+                          folder = '../../Data/Processed/usgs/streamflow_daily_parquet/',
+                          input_file = '../../Data/Downloaded/usgs/streamflow_daily_data.csv',
+                          **convert_kwargs):
+    #Gages of the daily streamflow (site_no, HR_NAME, lat and lon), converting
+    #the download first if they do not exist or are from an older download
+    if not streamflow_is_current(input_file, folder, file):
+        convert_daily_streamflow(input_file, output_folder = folder, sites_file = file, **convert_kwargs)
+    return pd.read_parquet(file, columns = site_columns)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 09:20:53 2026
+
+@author: alvar
+"""
+
+import numpy as np
+import pandas as pd
+from percentile_average_function import usdm_week_end, usdm_week
+
+
+def wide_matrix(df, date_column = 'date', column = 'site_no', value_column = 'flow', freq = 'D',
+                return_counts = False):
+    """Converts long data (one row per gage and date) into a dates x gages
+    matrix, averaging the values of each day or month
+
+    Parameters
+    ----------
+    df : dataframe
+        The long data
+    date_column : str
+        The column label of the dates
+    column : str
+        The column label of the gages (the columns of the matrix)
+    value_column : str
+        The column label of the values
+    freq : str
+        'D' for daily, 'W' for weekly means (U.S. Drought Monitor weeks, dated
+        at the Tuesday that ends the week) or 'M' for monthly means (dated at
+        the end of the month, as pd.Grouper(freq='1M'))
+    return_counts : boolean
+        If True, the number of values of each cell is also returned (the days
+        with data of each week or month for weekly or monthly means)
+
+    Returns
+    -------
+    tuple
+        the dates (rows), the gages (columns), the matrix (NaN where there
+        is no data) and, if return_counts, the matrix of counts
+    """
+    df = df.loc[df[date_column].notna() & df[column].notna()]
+    dates = pd.DatetimeIndex(df[date_column])
+    column_codes, columns = pd.factorize(df[column], sort=True)
+    if freq == 'D':
+        days = dates.normalize()
+        all_dates = pd.date_range(days.min(), days.max(), freq='D')
+        row_codes = (days - all_dates[0]).days.to_numpy()
+    elif freq == 'W':
+        weeks = usdm_week_end(dates)
+        all_dates = pd.date_range(weeks.min(), weeks.max(), freq='7D')
+        row_codes = (weeks - all_dates[0]).days.to_numpy()//7
+    elif freq == 'M':
+        months = np.asarray(dates.year*12 + dates.month - 1)
+        row_codes = months - months.min()
+        first = pd.Timestamp(year=months.min()//12, month=months.min()%12 + 1, day=1)
+        all_dates = pd.date_range(first, periods=row_codes.max() + 1, freq='MS') + pd.offsets.MonthEnd(0)
+    else:
+        raise NameError("freq has to be 'D', 'W' or 'M'")
+
+    shape = (len(all_dates), len(columns))
+    index = row_codes*shape[1] + column_codes
+    values = df[value_column].to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    sums = np.bincount(index[valid], weights=values[valid], minlength=shape[0]*shape[1])
+    counts = np.bincount(index[valid], minlength=shape[0]*shape[1])
+    with np.errstate(invalid='ignore'):
+        matrix = (sums/counts).reshape(shape)
+    if return_counts:
+        return all_dates, np.asarray(columns), matrix, counts.reshape(shape)
+    return all_dates, np.asarray(columns), matrix
+
+
+def rolling_completeness_mean(matrix, window, min_completeness = 0.8, counts = None,
+                              sizes = None):
+    """Rolling mean along the time axis of every column at once, with the
+    completeness of each window (the fraction of the time steps with data).
+    Windows with a completeness lower than min_completeness are NaN, so a few
+    missing days do not remove the whole window
+
+    Parameters
+    ----------
+    matrix : array
+        The dates x gages matrix
+    window : integer
+        The number of rows of the window (ending in each row)
+    min_completeness : float
+        The minimum completeness (0 to 1) to obtain the mean
+    counts : array, optional
+        The number of time steps with data of each cell (for instance the days
+        with data of each month, from wide_matrix). If None, 1 for the cells
+        with data
+    sizes : array, optional
+        The number of time steps of each row (for instance the days of each
+        month). If None, 1
+
+    Returns
+    -------
+    tuple
+        the rolling means (of the values with data) and the completeness of
+        each window (NaN for the first window - 1 rows)
+    """
+    valid = ~np.isnan(matrix)
+    if counts is None:
+        counts = valid
+    if sizes is None:
+        sizes = np.ones(matrix.shape[0])
+
+    def window_sum(values):
+        sums = np.cumsum(values, axis=0)
+        sums[window:] = sums[window:] - sums[:-window].copy()
+        return sums
+
+    n_values = window_sum(valid.astype('float64'))
+    steps_with_data = window_sum(np.where(valid, counts, 0).astype('float64'))
+    steps = window_sum(np.asarray(sizes, dtype='float64'))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = window_sum(np.where(valid, matrix, 0.0))/n_values
+        completeness = steps_with_data/steps[:, None]
+    completeness[:window-1] = np.nan
+    means[~(completeness>=min_completeness) | (n_values==0)] = np.nan
+    return means, completeness
+
+
+def calendar_slots(dates, slot = 'month'):
+    #Calendar slot of each date: month, month*100 + day (with February 29
+    #in the February 28 slot) or week of the year (of weeks ending on Tuesday)
+    dates = pd.DatetimeIndex(dates)
+    if slot == 'month':
+        return np.asarray(dates.month)
+    elif slot == 'day':
+        return np.asarray(dates.month*100 + np.where((dates.month==2) & (dates.day==29), 28, dates.day))
+    elif slot == 'week':
+        return usdm_week(dates)
+    raise NameError("slot has to be 'month', 'day' or 'week'")
+
+
+def slot_percentiles(dates, matrix, slot = 'month', baseline_start_year = 1991,
+                     baseline_end_year = 2020):
+    """Percentile of each value with respect to the values of the same gage and
+    calendar slot in the baseline years, as scipy.stats.percentileofscore
+    (kind='rank') ignoring missing values, for the whole matrix at once
+
+    Parameters
+    ----------
+    dates : DatetimeIndex
+        The dates of the rows
+    matrix : array
+        The dates x gages matrix
+    slot : str
+        'month' (calendar months), 'day' (calendar days) or 'week' (weeks of
+        the year)
+    baseline_start_year : integer
+        The first year of the baseline
+    baseline_end_year : integer
+        The last year of the baseline
+
+    Returns
+    -------
+    array
+        the percentiles (0 to 1), NaN for missing values or gages without
+        baseline in the slot
+    """
+    slots = calendar_slots(dates, slot)
+    years = np.asarray(pd.DatetimeIndex(dates).year)
+    percentiles = np.full(matrix.shape, np.nan)
+    for slot_value in np.unique(slots):
+        rows = np.flatnonzero(slots==slot_value)
+        values = matrix[rows]
+        baseline = matrix[rows[(years[rows]>=baseline_start_year) & (years[rows]<=baseline_end_year)]]
+        #Comparisons with NaN are False, so missing baseline values are ignored
+        left = (baseline[None, :, :] < values[:, None, :]).sum(axis=1)
+        right = (baseline[None, :, :] <= values[:, None, :]).sum(axis=1)
+        count = (~np.isnan(baseline)).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slot_percentiles = 0.5*(left + right + (right>left))/count
+        slot_percentiles[np.isnan(values) | (count==0)[None, :]] = np.nan
+        percentiles[rows] = slot_percentiles
+    return percentiles
+
+
+def membership_index(columns, column_groups, column = 'site_no', grouping_column = 'HR_NAME'):
+    """Columns of the matrix that belong to each group (a gage can be in more
+    than one group)
+
+    Parameters
+    ----------
+    columns : array
+        The gages of the matrix columns
+    column_groups : dataframe
+        The group of each gage (one row per gage and group)
+    column : str
+        The column label of the gages
+    grouping_column : str
+        The column label of the groups
+
+    Returns
+    -------
+    dict
+        the column indexes of each group
+    """
+    column_groups = column_groups[[column, grouping_column]].drop_duplicates()
+    position = pd.Index(columns).get_indexer(column_groups[column])
+    column_groups = column_groups.loc[position>=0].assign(position=position[position>=0])
+    return {group: np.sort(groupdf.position.to_numpy())
+            for group, groupdf in column_groups.groupby(grouping_column)}
+
+
+def group_nanmedian(matrix, membership):
+    """Median of the gages of each group, for every date, ignoring missing
+    values
+
+    Parameters
+    ----------
+    matrix : array
+        The dates x gages matrix
+    membership : dict
+        The column indexes of each group (from membership_index)
+
+    Returns
+    -------
+    tuple
+        the groups and the dates x groups matrix of medians
+    """
+    groups = list(membership)
+    medians = np.full((matrix.shape[0], len(groups)), np.nan)
+    with np.errstate(all='ignore'):
+        for i, group in enumerate(groups):
+            values = matrix[:, membership[group]]
+            has_data = (~np.isnan(values)).any(axis=1)
+            medians[has_data, i] = np.nanmedian(values[has_data], axis=1)
+    return groups, medians
+
+
+def to_long(dates, columns, matrices, date_column = 'date', column = 'site_no'):
+    """Converts dates x gages matrices into long data, keeping only the rows
+    with at least one value
+
+    Parameters
+    ----------
+    dates : DatetimeIndex
+        The dates of the rows
+    columns : array
+        The gages of the columns
+    matrices : dict
+        The matrices, by the column label they will have
+    date_column : str
+        The column label of the dates
+    column : str
+        The column label of the gages
+
+    Returns
+    -------
+    dataframe
+        one row per gage and date
+    """
+    df = pd.DataFrame({column: np.repeat(np.asarray(columns), len(dates)),
+                       date_column: np.tile(np.asarray(dates), len(columns))})
+    for name, matrix in matrices.items():
+        df[name] = matrix.T.ravel()
+    has_data = np.column_stack([df[name].notna() for name in matrices]).any(axis=1)
+    return df.loc[has_data].reset_index(drop=True)
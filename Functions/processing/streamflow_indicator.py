@@ -7,39 +7,49 @@ Created on Fri Apr 21 18:20:45 2023
 """
 
 import pandas as pd
-from percentile_average_function import func_for_tperiod
 import numpy as np
-
-sflow_data = pd.read_csv('../../Data/Downloaded/usgs/streamflow_daily_data.csv')
-sflow_data['date'] = pd.to_datetime(sflow_data.datetime)
-sflow_data = sflow_data[['date', '00060_Mean', '00060_Mean_cd', 'site_no','lat', 'lon', 'HR_NAME']]
-sflow_data = sflow_data.rename(columns={"00060_Mean": 'flow'})
-sflow_data.loc[sflow_data.flow<0] = np.nan
-
-
-
-sflow_percentile = func_for_tperiod(df=sflow_data, date_column = 'date', value_column = 'flow',
-                     input_timestep = '1D', analysis_period = '3M',
-                     function = 'percentile', grouping_column= 'site_no',
-                     correcting_no_reporting = False,
-                     baseline_start_year = 1991, baseline_end_year = 2020,
-                     remove_zero=False)
-
-
-site_hr = sflow_data[['site_no', 'HR_NAME']]
-site_hr = site_hr.drop_duplicates()
-
+from streamflow_functions import (wide_matrix, rolling_completeness_mean, slot_percentiles,
+                                  membership_index, group_nanmedian, to_long)
+from streamflow_data_ingest import load_daily_streamflow, load_streamflow_sites
+
+#Daily streamflow from the parquet dataset (one partition per gage, created in
+#chunks from streamflow_daily_data.csv the first time), loading only the
+#columns used. The days after the last daily value of each gage are the
+#provisional daily means from the instantaneous values (download_usgs_iv.py)
+sflow_data = load_daily_streamflow(folder = '../../Data/Processed/usgs/streamflow_daily_parquet/',
+                                   columns = ['datetime', '00060_Mean', 'site_no'],
+                                   provisional_file = '../../Data/Downloaded/usgs/streamflow_provisional_daily.csv',
+                                   input_file = '../../Data/Downloaded/usgs/streamflow_daily_data.csv')
+sflow_data = sflow_data.rename(columns={'datetime': 'date', "00060_Mean": 'flow'})
+#Negative flows are removed (only the flow, keeping the site of the record)
+sflow_data.loc[sflow_data.flow<0, 'flow'] = np.nan
+
+site_hr = load_streamflow_sites(file = '../../Data/Processed/usgs/streamflow_sites.parquet')
+
+
+#Monthly mean flow of every gage as a dates x gages matrix, 3-month rolling mean
+#and percentile of each calendar month (baseline 1991-2020), for all the gages
+#at once. The 3-month mean is obtained if at least 75% of the days of the window
+#have data
+dates, sites, flow, days_with_data = wide_matrix(sflow_data, date_column = 'date', column = 'site_no',
+                                                 value_column = 'flow', freq = 'M', return_counts = True)
+flow_3m, completeness = rolling_completeness_mean(flow, window = 3, min_completeness = 0.75,
+                                                  counts = days_with_data, sizes = dates.days_in_month)
+flow_pctl = slot_percentiles(dates, flow_3m, slot = 'month',
+                             baseline_start_year = 1991, baseline_end_year = 2020)
+
+sflow_percentile = to_long(dates, sites, {'flow': flow, 'value_period': flow_3m, 'completeness': completeness,
+                                          'percentile': flow_pctl})
 sflow_percentile = sflow_percentile.merge(site_hr, on='site_no')
-sflow_pctl_regional = sflow_percentile.groupby(['HR_NAME','date']).median().reset_index()
 
-sflow_pctl_regional = sflow_pctl_regional.rename(columns={'percentile':'median_percentile'})
 
-sflow_pctl_regional_corr = func_for_tperiod(df=sflow_pctl_regional, date_column = 'date', value_column = 'median_percentile',
-                     input_timestep = '1M', analysis_period = '1M',
-                     function = 'percentile', grouping_column= 'HR_NAME',
-                     correcting_no_reporting = False,
-                     baseline_start_year = 1991, baseline_end_year = 2020,
-                     remove_zero=False)
+#Regional median of the gage percentiles (through the gages of each region) and
+#percentile of the regional median
+regions, median_pctl = group_nanmedian(flow_pctl, membership_index(sites, site_hr))
+regional_pctl = slot_percentiles(dates, median_pctl, slot = 'month',
+                                 baseline_start_year = 1991, baseline_end_year = 2020)
+sflow_pctl_regional_corr = to_long(dates, regions, {'median_percentile': median_pctl, 'percentile': regional_pctl},
+                                   column = 'HR_NAME')
 
 sflow_percentile.to_csv('../../Data/Processed/streamflow_indicator/streamflow_individual_gages_indicator.csv')
 sflow_pctl_regional_corr.to_csv('../../Data/Processed/streamflow_indicator/streamflow_regional_indicator.csv')
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 26 09:02:18 2026
+
+@author: alvar
+"""
+
+import pandas as pd
+import numpy as np
+from streamflow_functions import (wide_matrix, rolling_completeness_mean, slot_percentiles,
+                                  membership_index, group_nanmedian, to_long)
+from streamflow_data_ingest import load_daily_streamflow, load_streamflow_sites
+
+#Daily streamflow from the parquet dataset (one partition per gage, created in
+#chunks from streamflow_daily_data.csv the first time), loading only the
+#columns used. The days after the last daily value of each gage are the
+#provisional daily means from the instantaneous values (download_usgs_iv.py)
+sflow_data = load_daily_streamflow(folder = '../../Data/Processed/usgs/streamflow_daily_parquet/',
+                                   columns = ['datetime', '00060_Mean', 'site_no'],
+                                   provisional_file = '../../Data/Downloaded/usgs/streamflow_provisional_daily.csv',
+                                   input_file = '../../Data/Downloaded/usgs/streamflow_daily_data.csv')
+sflow_data = sflow_data.rename(columns={'datetime': 'date', "00060_Mean": 'flow'})
+#Negative flows are removed (only the flow, keeping the site of the record)
+sflow_data.loc[sflow_data.flow<0, 'flow'] = np.nan
+
+site_hr = load_streamflow_sites(file = '../../Data/Processed/usgs/streamflow_sites.parquet')
+
+
+#Weekly mean flow of every gage in U.S. Drought Monitor weeks (ending on
+#Tuesday, dated at the Tuesday) and percentile of each week of the year
+#(baseline 1991-2020), for all the gages at once. The weekly mean is obtained
+#if at least 5 of the 7 days have data (the current week is incomplete until
+#Tuesday)
+dates, sites, flow, days_with_data = wide_matrix(sflow_data, date_column = 'date', column = 'site_no',
+                                                 value_column = 'flow', freq = 'W', return_counts = True)
+flow_1w, completeness = rolling_completeness_mean(flow, window = 1, min_completeness = 5/7,
+                                                  counts = days_with_data, sizes = np.full(len(dates), 7))
+flow_pctl = slot_percentiles(dates, flow_1w, slot = 'week',
+                             baseline_start_year = 1991, baseline_end_year = 2020)
+
+sflow_percentile = to_long(dates, sites, {'flow': flow_1w, 'completeness': completeness,
+                                          'percentile': flow_pctl})
+sflow_percentile = sflow_percentile.merge(site_hr, on='site_no')
+
+
+#Regional median of the gage percentiles and percentile of the regional median
+regions, median_pctl = group_nanmedian(flow_pctl, membership_index(sites, site_hr))
+regional_pctl = slot_percentiles(dates, median_pctl, slot = 'week',
+                                 baseline_start_year = 1991, baseline_end_year = 2020)
+sflow_pctl_regional = to_long(dates, regions, {'median_percentile': median_pctl, 'percentile': regional_pctl},
+                              column = 'HR_NAME')
+
+sflow_percentile.to_csv('../../Data/Processed/streamflow_indicator/streamflow_individual_gages_indicator_weekly.csv')
+sflow_pctl_regional.to_csv('../../Data/Processed/streamflow_indicator/streamflow_regional_indicator_weekly.csv')
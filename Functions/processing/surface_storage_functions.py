@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 09:48:31 2026
+
+@author: alvar
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from percentile_average_function import (func_for_tperiod, percentile_of_score, reporting_correction,
+                                         low_coverage_months)
+
+
+#Grouping schemes of the surface storage indicators. For each grouping column:
+#   zones: the aggregation zones. Each zone lists the hydrologic regions
+#       ('HR_NAME') whose reservoirs and snow regions are aggregated and,
+#       optionally, single reservoirs ('station', CDEC ids). Zones can overlap,
+#       like project service areas or contractor zones, for instance
+#       {'swp': {'station': ['ORO', 'SNL']}, 'cvp': {'station': ['SHA', 'FOL', 'NML', 'SNL']}}.
+#       None uses one zone per hydrologic region
+#   served_regions: the hydrologic regions that use the indicator of each zone
+#       (None if the zones are not used by other regions)
+#   uncorrected_until: for some zones, the date until which the reservoir
+#       storage is not corrected for no reporting (when the total storage is
+#       obtained)
+#   snow_fallback: if True, the total storage of the dates without snow water
+#       content is the reservoir storage alone. If False, the snow regions
+#       without data count as zero snow, and the total storage is missing for
+#       the dates without snow data for the zone
+#   output_folder: where the individual reservoir percentiles and the total
+#       storage percentiles are written
+grouping_schemes = {'HR_NAME': {'zones': None,
+                                'served_regions': None,
+                                'uncorrected_until': {'South Coast': '1999-12-01'},
+                                'snow_fallback': True,
+                                'output_folder': '../../Data/Processed/surface_water_drougth_indicator/'},
+                    'export_basin': {'zones': {'delta_basin': {'HR_NAME': ['Sacramento River', 'San Joaquin River']}},
+                                     'served_regions': {'delta_basin': ['San Joaquin River', 'Tulare Lake', 'South Coast']},
+                                     'uncorrected_until': None,
+                                     'snow_fallback': False,
+                                     'output_folder': '../../Data/Processed/imports/'}}
+
+
+def load_surface_storage(reservoir_file = '../../Data/Downloaded/cdec/reservoir/reservoirs.csv',
+                         snow_file = '../../Data/Downloaded/cdec/snow/SnowRegional.csv'):
+    """Reads the reservoir and regional snow data once, parsing the dates and
+    removing negative snow water content
+
+    Parameters
+    ----------
+    reservoir_file : str
+        The path to the monthly reservoir storage (from download_cdec_reservoir)
+    snow_file : str
+        The path to the monthly regional snow water content (from
+        download_cdec_snow)
+
+    Returns
+    -------
+    tuple
+        the reservoir data and the snow data
+    """
+    reservoir_data = pd.read_csv(reservoir_file)
+    snow_data = pd.read_csv(snow_file)
+
+    reservoir_data['date'] = pd.to_datetime(reservoir_data.date)
+    snow_data['date'] = pd.to_datetime(dict(year=snow_data.year, month=snow_data.month, day=1))
+    snow_data.loc[snow_data.SWC<0,'SWC']=0
+    return reservoir_data, snow_data
+
+
+def membership_matrix(df, member_column, zones = None):
+    """Membership of each reservoir (or snow region) in each aggregation zone
+
+    Parameters
+    ----------
+    df : dataframe
+        The reservoir or snow data, with the member column and HR_NAME
+    member_column : str
+        The column label of the members ('station' for the reservoirs and
+        'HR_NAME' for the snow regions)
+    zones : dict, optional
+        The aggregation zones (see grouping_schemes). If None, one zone per
+        hydrologic region
+
+    Returns
+    -------
+    tuple
+        the members, the zone names and the sparse members x zones matrix (1
+        if the member is in the zone)
+    """
+    members = df[list(dict.fromkeys([member_column, 'HR_NAME']))].drop_duplicates(member_column).reset_index(drop=True)
+    if zones is None:
+        zones = {hr_name: {'HR_NAME': [hr_name]} for hr_name in sorted(members.HR_NAME.dropna().unique())}
+    membership = np.column_stack([members.HR_NAME.isin(zone.get('HR_NAME', [])) |
+                                  members[member_column].isin(zone.get('station', []))
+                                  for zone in zones.values()])
+    return members[member_column].to_numpy(), list(zones), sparse.csr_matrix(membership.astype('float64'))
+
+
+def aggregate_zones(df, member_column, value_column, grouping_column, zones = None,
+                    capacity_column = None, keep_unreported = False):
+    """Aggregates the values of the reservoirs (or snow regions) of every zone
+    and date at once, with a date x member matrix multiplied by the membership
+    matrix. As in func_for_tperiod, missing and zero values are not reported
+
+    Parameters
+    ----------
+    df : dataframe
+        The reservoir or snow data (with date, the member column and HR_NAME)
+    member_column : str
+        The column label of the members
+    value_column : str
+        The column label of the values
+    grouping_column : str
+        The column label of the zones in the result
+    zones : dict, optional
+        The aggregation zones (see membership_matrix)
+    capacity_column : str, optional
+        The column label of the capacity, summed only for the members
+        reporting
+    keep_unreported : boolean
+        If True, the zones and dates with data but no member reporting are
+        kept, with a total value of zero
+
+    Returns
+    -------
+    dataframe
+        the total value (and capacity) and the number of members reporting
+        (n_reporting) of each zone and date with at least one member reporting
+        (or with data, if keep_unreported)
+    """
+    members, zone_names, membership = membership_matrix(df, member_column, zones)
+    reported = (df[value_column].notna() & (df[value_column] != 0)).to_numpy()
+    if not keep_unreported:
+        df = df.loc[reported]
+        reported = reported[reported]
+    dates, date_index = np.unique(df['date'].to_numpy(), return_inverse=True)
+    member_index = pd.Index(members).get_indexer(df[member_column])
+    shape = (len(dates), len(members))
+
+    def zone_sum(values):
+        return (sparse.csr_matrix((values, (date_index, member_index)), shape=shape) @ membership).toarray()
+
+    result = {value_column: zone_sum(np.where(reported, df[value_column].to_numpy(dtype='float64'), 0)),
+              'n_reporting': zone_sum(reported.astype('float64'))}
+    if capacity_column is not None:
+        result[capacity_column] = zone_sum(np.where(reported, df[capacity_column].to_numpy(dtype='float64'), 0))
+    n_rows = zone_sum(np.ones(len(df))).ravel()
+
+    zonedf = pd.DataFrame({'date': np.repeat(dates, len(zone_names)),
+                           grouping_column: np.tile(zone_names, len(dates))})
+    for column, values in result.items():
+        zonedf[column] = values.ravel()
+    return zonedf.loc[n_rows>0].reset_index(drop=True)
+
+
+def zones_to_regions(df, grouping_column, served_regions):
+    #Copies the indicator of each zone to the hydrologic regions it serves
+    regions = pd.DataFrame([(zone, hr_name) for zone, hr_names in served_regions.items() for hr_name in hr_names],
+                           columns=[grouping_column, 'HR_NAME'])
+    return df.merge(regions, on=grouping_column)
+
+
+def total_storage_swdi(reservoir_data, snow_data, grouping_column = 'HR_NAME',
+                       uncorrected_until = None, baseline_start_year = 1991,
+                       baseline_end_year = 2020, snow_fallback = True):
+    """Obtains the surface water drought indicator (SWDI) of each group: the
+    percentile of the total storage (reservoir storage corrected for no
+    reporting plus snow water content), with the reservoir storage and snow
+    percentiles
+
+    Parameters
+    ----------
+    reservoir_data : dataframe
+        The reservoir storage of each group (from aggregate_zones)
+    snow_data : dataframe
+        The snow water content of each group (from aggregate_zones)
+    grouping_column : str
+        The column label of the groups
+    uncorrected_until : dict, optional
+        For some groups, the date until which the reservoir storage is used
+        without the no reporting correction
+    baseline_start_year : integer
+        The first year of the baseline of the percentiles
+    baseline_end_year : integer
+        The last year of the baseline of the percentiles
+    snow_fallback : boolean
+        If True, the total storage of the dates without snow water content is
+        the reservoir storage alone (otherwise it is missing)
+
+    Returns
+    -------
+    dataframe
+        the total storage percentiles (SWDI), res_percentile, snow_pctl and
+        the reporting_coverage of the reservoirs (see reporting_correction) of
+        each group and month
+    """
+
+    #Aggregated reservoir storage of each group
+    res_group = func_for_tperiod(reservoir_data, date_column = 'date', value_column = 'value',
+                                 input_timestep = 'M', analysis_period = '1M',function = 'percentile',
+                                 grouping_column=grouping_column, correcting_no_reporting = True,
+                                 correcting_column = 'capacity',baseline_start_year = baseline_start_year,
+                                 baseline_end_year = baseline_end_year)
+
+    #Correcting date after obtaining aggregated data per group
+    res_group['month'] = res_group['date'].dt.month
+    res_group['year'] = res_group['date'].dt.year
+    res_group['date'] = pd.to_datetime(dict(year=res_group.year, month=res_group.month, day=1))
+
+    #snow_percentile (of the dates with snow regions reporting)
+    snow_perc = func_for_tperiod(snow_data.loc[snow_data.n_reporting>0], date_column = 'date', value_column = 'SWC',
+                                 input_timestep = 'M', analysis_period = '1M',function = 'percentile',
+                                 grouping_column=grouping_column, correcting_no_reporting = False,
+                                 baseline_start_year = baseline_start_year, baseline_end_year = baseline_end_year)
+    snow_perc['snow_pctl'] = snow_perc['percentile']
+    snow_perc = snow_perc[['date', grouping_column, 'SWC', 'snow_pctl']]
+
+    #Obtaining total storage as sum of reservoir storage and snow
+    total_storage = res_group.merge(snow_data[['date', grouping_column, 'SWC']], on=['date', grouping_column], how = 'outer')
+    total_storage['total_storage'] = total_storage.corrected_value + total_storage.SWC
+    if snow_fallback:
+        total_storage.loc[total_storage.SWC.isna()==True,'total_storage'] = total_storage.corrected_value
+    if uncorrected_until is not None:
+        for group, date in uncorrected_until.items():
+            total_storage.loc[(total_storage.date<date) & (total_storage[grouping_column]==group),'total_storage'] = total_storage.value
+
+    total_storage['res_percentile'] = total_storage['percentile']
+    total_storage['reservoir_storage'] = total_storage['value']
+    total_storage_for_calculation = total_storage[['date','reservoir_storage', 'res_percentile', 'reporting_coverage', 'total_storage', grouping_column]]
+
+    tot_stor_perc = func_for_tperiod(total_storage_for_calculation, date_column = 'date', value_column = 'total_storage',
+                                     input_timestep = 'M', analysis_period = '1M',function = 'percentile',
+                                     grouping_column=grouping_column, correcting_no_reporting = False,
+                                     baseline_start_year = baseline_start_year, baseline_end_year = baseline_end_year)
+
+    tot_stor_perc = tot_stor_perc.merge(snow_perc, on = ['date', grouping_column], how = 'outer')
+    tot_stor_perc.loc[tot_stor_perc.snow_pctl.isna() == True, 'snow_pctl'] = 0.5
+
+    return tot_stor_perc.rename(columns={'percentile': 'SWDI'})
+
+
+def run_surface_storage(reservoir_data, snow_data, schemes = grouping_schemes,
+                        baseline_start_year = 1991, baseline_end_year = 2020, write = True):
+    """Surface storage pipeline for several grouping schemes (hydrologic
+    regions for the SWDI, Delta exporting basins for the imports...). The
+    individual reservoir percentiles are obtained once and shared by all the
+    schemes; the reservoirs and snow regions are aggregated into all the zones
+    of each scheme at once (see aggregate_zones) and then the SWDI of each zone
+    is obtained
+
+    Parameters
+    ----------
+    reservoir_data : dataframe
+        The reservoir data (from load_surface_storage)
+    snow_data : dataframe
+        The regional snow data (from load_surface_storage)
+    schemes : dict
+        The grouping schemes by grouping column (see grouping_schemes)
+    baseline_start_year : integer
+        The first year of the baseline of the percentiles
+    baseline_end_year : integer
+        The last year of the baseline of the percentiles
+    write : boolean
+        If True, the results of each scheme are written to its output_folder
+        (individual_reservoir_percentiles.csv, total_storage_percentiles.csv,
+        low_coverage_months.csv with the months of each zone with few
+        reservoirs reporting (see low_coverage_months) and, for the schemes
+        with served_regions, regional_total_storage_percentiles.csv with the
+        indicator of each hydrologic region served)
+
+    Returns
+    -------
+    tuple
+        the individual reservoir percentiles (with the no reporting correction)
+        and a dict with the SWDI of each scheme
+    """
+
+    #Individual reservoirs: each station is independent of the grouping
+    res_ind = func_for_tperiod(reservoir_data, date_column = 'date', value_column = 'value',
+                               input_timestep = 'M', analysis_period = '1M',function = 'percentile',
+                               grouping_column='station', correcting_no_reporting = True,
+                               correcting_column = 'capacity',baseline_start_year = baseline_start_year,
+                               baseline_end_year = baseline_end_year)
+
+    results = {}
+    for grouping_column, scheme in schemes.items():
+        reservoir_zones = aggregate_zones(reservoir_data, 'station', 'value', grouping_column,
+                                          scheme['zones'], capacity_column = 'capacity')
+        snow_zones = aggregate_zones(snow_data, 'HR_NAME', 'SWC', grouping_column, scheme['zones'],
+                                     keep_unreported = not scheme.get('snow_fallback', True))
+        results[grouping_column] = total_storage_swdi(reservoir_zones, snow_zones, grouping_column,
+                                                      uncorrected_until = scheme.get('uncorrected_until'),
+                                                      baseline_start_year = baseline_start_year,
+                                                      baseline_end_year = baseline_end_year,
+                                                      snow_fallback = scheme.get('snow_fallback', True))
+        if write:
+            os.makedirs(scheme['output_folder'], exist_ok=True)
+            members, _, membership = membership_matrix(reservoir_data, 'station', scheme['zones'])
+            stations = members[membership.getnnz(axis=1)>0]
+            res_ind.loc[res_ind.station.isin(stations)].reset_index(drop=True).to_csv(
+                os.path.join(scheme['output_folder'], 'individual_reservoir_percentiles.csv'))
+            results[grouping_column].to_csv(os.path.join(scheme['output_folder'], 'total_storage_percentiles.csv'))
+            low_coverage_months(results[grouping_column], grouping_column).to_csv(
+                os.path.join(scheme['output_folder'], 'low_coverage_months.csv'))
+            if scheme.get('served_regions') is not None:
+                zones_to_regions(results[grouping_column], grouping_column, scheme['served_regions']).to_csv(
+                    os.path.join(scheme['output_folder'], 'regional_total_storage_percentiles.csv'))
+    return res_ind, results
+
+
+def load_daily_surface_storage(reservoir_file = '../../Data/Downloaded/cdec/reservoir/reservoirs_daily.csv',
+                               snow_file = '../../Data/Downloaded/cdec/snow/SnowRegionalDaily.csv'):
+    """Reads the daily reservoir storage and regional snow water content (from
+    download_cdec_daily), parsing the dates and removing negative snow water
+    content
+
+    Parameters
+    ----------
+    reservoir_file : str
+        The path to the daily reservoir storage
+    snow_file : str
+        The path to the daily regional snow water content
+
+    Returns
+    -------
+    tuple
+        the daily reservoir data and the daily snow data
+    """
+    reservoir_data = pd.read_csv(reservoir_file, parse_dates = ['date'])
+    snow_data = pd.read_csv(snow_file, parse_dates = ['date'])
+    snow_data.loc[snow_data.SWC<0,'SWC']=0
+    return reservoir_data, snow_data
+
+
+def daily_percentiles(df, value_column, grouping_column, baseline_start_year = 1991,
+                      baseline_end_year = 2020):
+    """Percentile of each daily value with respect to the values of the same
+    group and calendar day in the baseline years (February 29 uses the
+    February 28 baseline)
+
+    Parameters
+    ----------
+    df : dataframe
+        The daily data, with date, the grouping column and the value column
+    value_column : str
+        The column label of the values
+    grouping_column : str
+        The column label of the groups
+    baseline_start_year : integer
+        The first year of the baseline
+    baseline_end_year : integer
+        The last year of the baseline
+
+    Returns
+    -------
+    array
+        the percentile (0 to 1) of each row
+    """
+    group_codes, _ = pd.factorize(df[grouping_column])
+    day = np.where((df.date.dt.month==2) & (df.date.dt.day==29), 28, df.date.dt.day)
+    slots = group_codes*1300 + df.date.dt.month.to_numpy()*100 + day
+    baseline = ((df.date.dt.year>=baseline_start_year) & (df.date.dt.year<=baseline_end_year)).to_numpy()
+    values = df[value_column].to_numpy(dtype='float64')
+    return percentile_of_score(slots[baseline], values[baseline], slots, values)
+
+
+def daily_total_storage_swdi(reservoir_data, snow_data, grouping_column = 'HR_NAME',
+                             uncorrected_until = None, baseline_start_year = 1991,
+                             baseline_end_year = 2020, snow_fallback = True):
+    """Daily surface water drought indicator (SWDI) of each group: as in
+    total_storage_swdi, but with daily data and a daily baseline (vectorized,
+    without func_for_tperiod)
+
+    Parameters
+    ----------
+    As in total_storage_swdi, with the daily storage and snow water content of
+    each group (from aggregate_zones)
+
+    Returns
+    -------
+    dataframe
+        the daily reservoir storage (corrected for no reporting), snow water
+        content, total storage and their percentiles (res_percentile,
+        snow_pctl and SWDI) of each group
+    """
+    #Correction for stations not reporting, with the capacity reporting on the
+    #same calendar day
+    res_group = reporting_correction(reservoir_data, grouping_column, slot = 'day',
+                                     baseline_start_year = baseline_start_year,
+                                     baseline_end_year = baseline_end_year)
+    res_group['res_percentile'] = daily_percentiles(res_group, 'value', grouping_column,
+                                                    baseline_start_year, baseline_end_year)
+
+    snow_group = snow_data[['date', grouping_column, 'SWC']].copy()
+    reported = (snow_data.n_reporting>0).to_numpy()
+    snow_group['snow_pctl'] = np.nan
+    snow_group.loc[reported, 'snow_pctl'] = daily_percentiles(snow_group.loc[reported], 'SWC', grouping_column,
+                                                              baseline_start_year, baseline_end_year)
+
+    #Obtaining total storage as sum of reservoir storage and snow
+    total_storage = res_group.merge(snow_group, on=['date', grouping_column], how = 'outer')
+    total_storage['total_storage'] = total_storage.corrected_value + total_storage.SWC
+    if snow_fallback:
+        total_storage.loc[total_storage.SWC.isna()==True,'total_storage'] = total_storage.corrected_value
+    if uncorrected_until is not None:
+        for group, date in uncorrected_until.items():
+            total_storage.loc[(total_storage.date<date) & (total_storage[grouping_column]==group),'total_storage'] = total_storage.value
+    total_storage['reservoir_storage'] = total_storage['value']
+
+    total_storage['SWDI'] = daily_percentiles(total_storage, 'total_storage', grouping_column,
+                                              baseline_start_year, baseline_end_year)
+    total_storage.loc[total_storage.snow_pctl.isna() == True, 'snow_pctl'] = 0.5
+    return total_storage.sort_values([grouping_column, 'date']).reset_index(drop=True)
+
+
+def run_daily_surface_storage(reservoir_data, snow_data, schemes = grouping_schemes,
+                              baseline_start_year = 1991, baseline_end_year = 2020, write = True):
+    """Daily surface storage pipeline for several grouping schemes, as
+    run_surface_storage but with daily data (see daily_total_storage_swdi)
+
+    Parameters
+    ----------
+    As in run_surface_storage, with the daily data from
+    load_daily_surface_storage. The results are written as
+    total_storage_percentiles_daily.csv, low_coverage_daily.csv (the days of
+    each zone with few reservoirs reporting) and
+    regional_total_storage_percentiles_daily.csv
+
+    Returns
+    -------
+    dict
+        the daily SWDI of each scheme
+    """
+    results = {}
+    for grouping_column, scheme in schemes.items():
+        reservoir_zones = aggregate_zones(reservoir_data, 'station', 'value', grouping_column,
+                                          scheme['zones'], capacity_column = 'capacity')
+        snow_zones = aggregate_zones(snow_data, 'HR_NAME', 'SWC', grouping_column, scheme['zones'],
+                                     keep_unreported = not scheme.get('snow_fallback', True))
+        results[grouping_column] = daily_total_storage_swdi(reservoir_zones, snow_zones, grouping_column,
+                                                            uncorrected_until = scheme.get('uncorrected_until'),
+                                                            baseline_start_year = baseline_start_year,
+                                                            baseline_end_year = baseline_end_year,
+                                                            snow_fallback = scheme.get('snow_fallback', True))
+        if write:
+            os.makedirs(scheme['output_folder'], exist_ok=True)
+            results[grouping_column].to_csv(os.path.join(scheme['output_folder'], 'total_storage_percentiles_daily.csv'))
+            low_coverage_months(results[grouping_column], grouping_column).to_csv(
+                os.path.join(scheme['output_folder'], 'low_coverage_daily.csv'))
+            if scheme.get('served_regions') is not None:
+                zones_to_regions(results[grouping_column], grouping_column, scheme['served_regions']).to_csv(
+                    os.path.join(scheme['output_folder'], 'regional_total_storage_percentiles_daily.csv'))
+    return results
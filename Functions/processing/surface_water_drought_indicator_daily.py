@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 10:12:27 2026
+
+@author: alvar
+"""
+
+from surface_storage_functions import load_daily_surface_storage, run_daily_surface_storage, grouping_schemes
+
+
+#Daily reservoir storage and regional snow water content (updated each morning
+#with download_cdec_daily.py)
+reservoir_data, snow_data = load_daily_surface_storage(reservoir_file = '../../Data/Downloaded/cdec/reservoir/reservoirs_daily.csv',
+                                                       snow_file = '../../Data/Downloaded/cdec/snow/SnowRegionalDaily.csv')
+
+#Daily SWDI of every grouping scheme, with a daily baseline (same calendar day
+#of 1991-2020). Each scheme writes total_storage_percentiles_daily.csv to its
+#output folder
+swdi_daily = run_daily_surface_storage(reservoir_data, snow_data, schemes = grouping_schemes,
+                                       baseline_start_year = 1991, baseline_end_year = 2020)
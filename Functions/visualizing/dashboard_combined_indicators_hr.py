@@ -46,16 +46,12 @@ pet_indicator = pd.read_csv('../../Data/Processed/pr_pet_hr_indicators/pet_perce
 sw_indicator = pd.read_csv('../../Data/Processed/surface_water_drougth_indicator/total_storage_percentiles.csv')
 gw_indicator = pd.read_csv('../../Data/Processed/groundwater/state_wells_regional_analysis.csv')
 sflow_indicator = pd.read_csv('../../Data/Processed/streamflow_indicator/streamflow_regional_indicator.csv')
-imports_indicator = pd.read_csv('../../Data/Processed/imports/total_storage_percentiles.csv')
+#Imports indicator of each importing region (the regions served by each
+#export zone are defined in grouping_schemes, in surface_storage_functions.py)
+imports_indicator = pd.read_csv('../../Data/Processed/imports/regional_total_storage_percentiles.csv')
 imports_indicator = imports_indicator.rename(columns={'SWDI': 'SWDI_imports'})
 #Import basins
-imp_basins = ['San Joaquin River', 'Tulare Lake', 'South Coast']
-imp_basins2 = pd.concat([imports_indicator,imports_indicator,imports_indicator]).reset_index(drop=True)
-imp_basins2['HR_NAME']= imp_basins[0]
-imp_basins2.loc[600:1200, 'HR_NAME'] = imp_basins[1]
-imp_basins2.loc[1200:1800, 'HR_NAME'] = imp_basins[2]
-imports_indicator = imp_basins2
-del imp_basins2
+imp_basins = list(imports_indicator.HR_NAME.unique())
 
 
 #To datetime
@@ -368,10 +368,11 @@ def vis_streamflow_dashboard(hr='San Joaquin River', date='2011-11-30', hydrogra
     df = df[df.HR_NAME==hr]
     
     #  Modify individual reservoirs data to properly facilitate plotting
-    df_gages = df_gages[df_gages.date==date]
+    #  Gages of the region from their HR_NAME (the gages of the regional indicator),
+    #  instead of clipping all the gages with the region
+    df_gages = df_gages[(df_gages.date==date) & (df_gages.HR_NAME==hr)]
     df_gages = df_gages[(~df_gages.lon.isna()) & (~df_gages.lat.isna())]
     df_gages = gpd.GeoDataFrame(df_gages, geometry=gpd.points_from_xy(df_gages.lon, df_gages.lat)).set_crs('epsg:4326').to_crs('epsg:3857')
-    df_gages = gpd.clip(df_gages, hr_shapes)
     df_gages['color_pctl'] = color_function_df(df_gages, 'percentile')
     
     #Modify rivers
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Functions', 'processing'))
+from groundwater_percentile_function import basin_pctl_analysis, read_basin_analysis
+
+
+def measurements():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('1995-01-15', '2020-12-15', freq='MS') + pd.Timedelta(days=14)
+    rows = [pd.DataFrame({'stn_id': basin + str(well), 'basin_name': basin, 'msmt_date': dates,
+                          'gse_gwe': 50 + rng.normal(0, 5, len(dates))})
+            for basin in ['A', 'B'] for well in range(3)]
+    return pd.concat(rows, ignore_index=True)
+
+
+def test_basin_pctl_analysis_replaces_previous_output(tmp_path):
+    folder = str(tmp_path / 'basin_analysis')
+    _, first = basin_pctl_analysis(measurements(), n_jobs=1, output_folder=folder,
+                                   initial_date='1995-01-01')
+    _, second = basin_pctl_analysis(measurements(), n_jobs=1, output_folder=folder,
+                                    initial_date='1995-01-01')
+
+    stored = read_basin_analysis(folder)
+    assert len(first) == len(second)
+    assert len(stored) == len(second)
+    assert len(read_basin_analysis(folder, basins=['A'])) == (second.basin_name == 'A').sum()
+    assert not os.path.exists(folder + '.tmp')